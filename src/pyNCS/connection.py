@@ -22,7 +22,8 @@ class Connection(object):
                  fashion_kwargs={},
                  connection_kwargs={},
                  append=True,
-                 setup=None):
+                 setup=None,
+                 seed=None):
         """
         - popsrc: source population
         - popdst: destination population
@@ -31,6 +32,7 @@ class Connection(object):
         - fashion_kwargs: arguments for fashion-type connectivity
         - append: whether to append this connection to the setup mapping table
         - setup: specify setup if different from popsrc.setup
+        - seed: seed of the random connectivity (see Mapping.seed)
         """
         self.mapping = self._create_mapping(popsrc, popdst, synapse)
         self.mapping.connect(
@@ -38,7 +40,8 @@ class Connection(object):
                 popdst.synapses[synapse],
                 connection_kwargs = connection_kwargs,
                 fashion=fashion,
-                fashion_kwargs=fashion_kwargs)
+                fashion_kwargs=fashion_kwargs,
+                seed=seed)
         self.mapping.prepare()
         if setup is None:
             setup = popsrc.setup
@@ -462,12 +462,9 @@ class AddrGroup(AddrGroupBase):
             print("AddrGroup is empty!")
             return stStim
 
-        for i, id in enumerate(self.laddr):
-            stStim[id] = STCreate.regular_gaussian_generator(rate[i],
-                                                    phase=offset[i],
-                                                    scale=scale,
-                                                    t_start=t_start,
-                                                    t_stop=t_start + duration)
+        stStim = STCreate.regular_gaussian_population(
+            rate, phases=offset, scale=scale, t_start=t_start,
+            t_stop=t_start + duration, id_list=self.laddr)
 
         if channel is None:
             channel = self.channel
@@ -503,12 +500,9 @@ class AddrGroup(AddrGroupBase):
             print("AddrGroup is empty!")
             return stStim
 
-        for i, id in enumerate(self.laddr):
-            stStim[id] = STCreate.regular_generator(rate[i],
-                                                    phase=offset[i],
-                                                    jitter=jitter,
-                                                    t_start=t_start,
-                                                    t_stop=t_start + duration)
+        stStim = STCreate.regular_population(
+            rate, phases=offset, jitter=jitter, t_start=t_start,
+            t_stop=t_start + duration, id_list=self.laddr)
 
         if channel is None:
             channel = self.channel
@@ -532,9 +526,37 @@ class AddrGroup(AddrGroupBase):
             print("AddrGroup is empty!")
             return stStim
 
-        for i, id in enumerate(self.laddr):
-            stStim[id] = STCreate.poisson_generator(
-                rate[i], t_start=t_start, t_stop=t_start + duration)
+        stStim = STCreate.poisson_population(
+            rate, t_start=t_start, t_stop=t_start + duration, id_list=self.laddr)
+
+        if channel is None:
+            channel = self.channel
+
+        return {channel: stStim}
+
+    def spiketrains_correlated(self, rate, c, jitter=0., t_start=0.,
+                               duration=1000., process='mip', channel=None):
+        """
+        Create correlated poisson spiketrains for the addresses of the group,
+        with pairwise correlation coefficients *c* (a value, or one per
+        address for MIP) and a gaussian *jitter* (in ms) of the shared spikes.
+        *process* is 'mip' (Multiple Interaction Process) or 'sip' (Single
+        Interaction Process).
+        You can use channel argument to enforce a particular channel.
+        See also pyST.STCreate.mip_population, pyST.STCreate.sip_population
+        """
+        stStim = SpikeList([], id_list=[])
+
+        if hasattr(rate, '__len__') and len(self.laddr) != len(rate):
+            raise RuntimeError('Rate vector must be of the same length as the number of neurons in population: {0}'.format(len(self.addr)))
+
+        if self.is_empty():
+            print("AddrGroup is empty!")
+            return stStim
+
+        generator = getattr(STCreate, process + '_population')
+        stStim = generator(rate, c, jitter=jitter, t_start=t_start,
+                           t_stop=t_start + duration, id_list=self.laddr)
 
         if channel is None:
             channel = self.channel
@@ -548,9 +570,70 @@ class AddrGroup(AddrGroupBase):
         The second dimension corresponds to the time bin. The length of this must be the same as t.
         In addition, the rates *must* end with 0 to mark the end of the last bin.
         keyword arguments kwargs are passed to the spiketrain generator.
-        See also pyST.STCreate.inh_poisson_generator
+        See also pyST.STCreate.inh_poisson_population
         """
-        return self.spiketrains_inh_generator(rate, t, channel, base_generator=STCreate.poisson_generator, **kwargs)
+        stStim = SpikeList([], id_list=[])
+
+        if len(self.addr) != rate.shape[0]:
+            raise RuntimeError('Rate vector must be of the same length as the number of neurons in population: {0}'.format(self.laddr))
+
+        assert rate.shape[1] == len(
+            t), "time vector must be compatible with time axis of rate"
+
+        if self.is_empty():
+            print("AddrGroup is empty!")
+            return stStim
+
+        stStim = STCreate.inh_poisson_population(
+            rate, t, t_stop=t[-1], id_list=self.laddr, **kwargs)
+
+        if channel is None:
+            channel = self.channel
+
+        return {channel: stStim}
+
+    def spiketrains_stream(self, method='inh_poisson_population', chunk_duration=1000., t_start=0., duration=None, **params):
+        """
+        Generator of a continuous stimulus for the group, in chunks of
+        chunk_duration ms, to be sent with NeuroSetup.stimulate_stream. The
+        chunks are already encoded: every chunk is a uint32 array of (physical
+        address, inter-spike interval in us). The intervals are counted across
+        the chunks, so that the timestamps never overflow in long sessions.
+
+        The spikes are generated by STCreate.population_stream with the given
+        method and params, which carries the state of the processes between
+        the chunks. Parameters per neuron are in the order of self.laddr.
+        duration=None streams forever. New parameters can be sent to the
+        generator, as a dict, to change them from the next chunk on.
+
+        Example:
+        >> stream = group.spiketrains_stream('inh_gamma_population', 500.,
+                                             a=2., b=.025)
+        >> nsetup.stimulate_stream(stream)
+        """
+        if duration is None:
+            t_stop = None
+        else:
+            t_stop = t_start + duration
+        spikes = STCreate.population_stream(method, chunk_duration,
+                                            t_start=t_start, t_stop=t_stop,
+                                            id_list=np.arange(len(self)),
+                                            **params)
+        paddr = self.paddr
+        # time of the previous event, in us
+        t_prev = 0
+        update = None
+        while True:
+            try:
+                ids, times = spikes.send(update)
+            except StopIteration:
+                return
+            order = np.argsort(times, kind='mergesort')
+            tm = np.floor(times[order] * 1000).astype('int64')
+            isi = np.diff(np.concatenate([[t_prev], tm]))
+            if len(tm) > 0:
+                t_prev = tm[-1]
+            update = yield np.column_stack([paddr[ids[order]], isi]).astype('uint32')
 
     def spiketrains_inh_generator(self, rate, t, channel=None, base_generator=None, **kwargs):
         """
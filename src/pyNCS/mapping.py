@@ -17,9 +17,15 @@ class Mapping(object):
     """
     A class representing the mapping between groups of chip addresses.
     """
+    # Random connectivity is drawn from the global numpy random state, unless
+    # the mapping is seeded
+    rng = np.random
 
-    def __init__(self, name, description=None):
+    def __init__(self, name, description=None, seed=None):
         """
+        - name: the name of the mapping
+        - description: a description of the mapping
+        - seed: seed of the random connectivity of this mapping (see seed)
         """
         # TODO: proper pickling
         # TODO: restore graph from mappings
@@ -31,6 +37,18 @@ class Mapping(object):
                                 between addresses.'
         self.name = "\"" + 'AER connectivity' + "\""
         self.mapping = []
+        if seed is not None:
+            self.seed(seed)
+
+    def seed(self, seed):
+        """
+        Draw the random connectivity of this mapping from its own random
+        state, seeded with seed (an integer, or e.g. one of the seeds of
+        pyST.stgen.spawn_seeds), instead of the global numpy random state.
+        Random connections are then reproducible independently of any other
+        use of numpy.random.
+        """
+        self.rng = np.random.RandomState(seed)
 
     def __getstate__(self):
         """
@@ -58,9 +76,9 @@ class Mapping(object):
 
     def __instance_from_matrix_random(self, M):
         try:
-            return np.random.binomial(1, M.tolist()).astype('bool')
+            return self.rng.binomial(1, M.tolist()).astype('bool')
         except:
-            return np.random.binomial(1,M).astype('bool')
+            return self.rng.binomial(1,M).astype('bool')
 
     def import_from_connections(self, connections_list):
         """
@@ -105,7 +123,7 @@ class Mapping(object):
         else:
             self.mapping = pyncs_mapping.mapping
 
-    def connect(self, groupsrc, groupdst, expand=True, fashion='one2one', fashion_kwargs={}, connection_kwargs={}, check=True):
+    def connect(self, groupsrc, groupdst, expand=True, fashion='one2one', fashion_kwargs={}, connection_kwargs={}, check=True, seed=None):
         """
         Wrap the connect call to all type of different connectivity functions.
         
@@ -114,6 +132,8 @@ class Mapping(object):
         
         When check is True synapses cannot be output addresses and somas cannot be input addresses.
 
+        If seed is given, the mapping is seeded with it before connecting (see seed).
+
         *Example:*
         >>  mymapping.connect(src, dst, "all2all", expand = false)
         which is equivalent to:
@@ -122,6 +142,8 @@ class Mapping(object):
         if not expand:
             self.clear()
 
+        if seed is not None:
+            self.seed(seed)
 
         if check and not self.is_connect_possible(groupsrc, groupdst):
             return []
@@ -262,12 +284,12 @@ class Mapping(object):
             connect_inst[:integ, i] = True
             # Deal with fractional part by rolling a dice and checking not to
             # overrun
-            if np.random.rand() < frac and integ + 1 < len(groupsrc):
+            if self.rng.rand() < frac and integ + 1 < len(groupsrc):
                 connect_inst[integ + 1, i] = True
 
         #... and shuffle them
         for i in range(connect_inst.shape[1]):
-            np.random.shuffle(connect_inst[:, i])
+            self.rng.shuffle(connect_inst[:, i])
 
         #TODO: go through binary matrix
 
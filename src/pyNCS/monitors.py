@@ -11,6 +11,7 @@ import numpy as np
 import pylab
 from collections import defaultdict
 from .pyST.STsl import mapSpikeListAddresses, composite_plot, SpikeList, SpikeTrain, merge_spikelists
+from .pyST.spikes import SpikeTrials
 import copy
 
 def create_SpikeMonitor_from_SpikeList(st):
@@ -161,6 +162,21 @@ class Monitors(object):
         """
         return self.import_monitors_otf(populations, synapse=None, append=True)
 
+    def create_trials(self):
+        """
+        Returns a list of empty SpikeTrials, one per SpikeMonitor, to be filled
+        by append_trials.
+        """
+        return [SpikeTrials(mon.addr_group.laddr) for mon in self]
+
+    def append_trials(self, trials, onset=0.):
+        """
+        Appends the current SpikeLists of the SpikeMonitors to the SpikeTrials
+        returned by create_trials, as a trial starting at *onset* (in ms).
+        """
+        for tr, mon in zip(trials, self):
+            tr.append(mon.sl, onset)
+
     def iter_spikelists(self):
         for mon in self:
             yield mon.sl
@@ -171,6 +187,24 @@ class Monitors(object):
                     s_start=float(i),
                     s_stop=float(i))
 
+    def sparse_spike_histogram(self, time_bin, t_start=None, t_stop=None, *args, **kwargs):
+        """
+        Returns the spike counts of all the SpikeMonitors in bins of time_bin,
+        as a scipy.sparse CSR matrix with the neurons of every monitor stacked
+        in rows, in the order of the monitors. The bins are common to all the
+        monitors, from get_t_start() to get_t_stop() by default.
+        *args* and *kwargs* (dtype, tau) are passed to
+        SpikeList.sparse_spike_histogram.
+        """
+        from scipy import sparse
+        if t_start is None:
+            t_start = self.get_t_start()
+        if t_stop is None:
+            t_stop = self.get_t_stop()
+        return sparse.vstack(
+            [st.sparse_spike_histogram(time_bin, t_start, t_stop, *args, **kwargs)
+             for st in self.iter_spikelists()], format='csr')
+
     def raster_plot(self, *args, **kwargs):
         """
         Raster Plotting tool which can handle plotting several SpikeLists/ SpikeMonitors/ monitorSpikeLists
@@ -319,7 +353,9 @@ class RasterPlot(PlotBase):
     *flat* : if true, the spike lists are flattened before plotting
     *even_distance* : if true, the distance between the rasters is fixed.
     plot_kwargs is passed to the final matplotlib plotting function.
-    kwargs are passed to raster_plot
+    kwargs are passed to raster_plot, for example density=True to draw the
+    spikes as a density image (used by default for large monitors) or
+    decimate=10 to plot only every tenth neuron.
     """
 
     def __init__(self, monitors, flat=False, even_distance = False, plot_kwargs={}, *args, **kwargs):
@@ -18,6 +18,7 @@ from .mapping import Mapping, PMapping
 from .monitors import Monitors
 from . import pyST
 import warnings, os
+import numpy as np
 from contextlib import contextmanager
 from lxml import etree
 from itertools import chain
@@ -439,9 +440,14 @@ class NeuroSetup(object):
         return self.setuptype, self.setupfile
 
     def _pre_process(self, stim):
-        if stim == None:
-            stim = self.sequencers
-        evs_in = self.mon.exportAER(stim, isi=True)
+        if isinstance(stim, np.ndarray):
+            # Stimulus already encoded, e.g. by a pyST.StimulusCache
+            evs_in = pyST.events(stim, atype='p')
+            evs_in.set_isi()
+        else:
+            if stim is None:
+                stim = self.sequencers
+            evs_in = self.mon.exportAER(stim, isi=True)
         evs = self.mapper.filter_events(evs_in)
         return evs.get_adtmev()
 
@@ -473,6 +479,49 @@ class NeuroSetup(object):
         else:
             return np.zeros([0,2],dtype='uint32')
 
+    def run_trials(self, n_trials, stim=None, onsets=None, **kwargs):
+        '''
+        Prepares and stimulates n_trials times with the same stimulus.
+        Returns a list of pyST.SpikeTrials, one per monitor, with the monitored
+        spikes of every trial aligned on *onsets* (a list of times in ms, 0 for
+        all the trials by default).
+        *kwargs* are keyword arguments passed to self.communicator.run()
+        Trials cannot be run offline, since nothing would be recorded.
+        '''
+        if self.offline:
+            raise RuntimeError('Trials cannot be run offline')
+        if onsets is None:
+            onsets = [0.] * n_trials
+        elif len(onsets) != n_trials:
+            raise ValueError('{0} onsets given for {1} trials'.format(
+                len(onsets), n_trials))
+        self.prepare()
+        trials = self.monitors.create_trials()
+        for onset in onsets:
+            self.stimulate(stim, **kwargs)
+            self.monitors.append_trials(trials, onset)
+        return trials
+
+    def stimulate_stream(self, stream, callback=None, **kwargs):
+        '''
+        Stimulate continuously with the chunks of *stream*, an iterable of
+        encoded events in (addr, isi) format such as
+        AddrGroup.spiketrains_stream. Every chunk is sent with
+        self.communicator.stim as soon as it is generated, so a stimulus of
+        any duration is never held in memory.
+        Requires a continuous communicator (see ComAPI.ContinuousCommunicatorBase).
+        *callback*: if given, called with the output of communicator.stim for every chunk.
+        *kwargs* are keyword arguments passed to self.communicator.stim()
+        '''
+        if not hasattr(self.communicator, 'stim'):
+            raise TypeError('Streaming requires a continuous communicator')
+        for chunk in stream:
+            evs = pyST.events(chunk, atype='p', isISI=True)
+            evs = self.mapper.filter_events(evs)
+            out = self.communicator.stim(evs.get_adtmev(), **kwargs)
+            if callback is not None:
+                callback(out)
+
     def stimulate_raw(self, raw_stim, **kwargs):
         '''
         Calls communicator.run without pre- or post-processing
@@ -7,12 +7,13 @@
 # Licence : GPLv2
 #-----------------------------------------------------------------------------
 from __future__ import absolute_import
-import os
+import warnings
 import numpy as np
 import pylab
 import matplotlib
 from . import pyST_globals
 from . import stgen
+from . import spikes
 from .spikes import SpikeList, SpikeTrain, load, merge, merge_spikelists
 
 #Globals
@@ -21,10 +22,12 @@ timeIndex = 1
 STCreate = stgen.StGen()
 
 
-def plot_raster(SL, id_list=None, t_start=None, t_stop=None, display=True, id_color=None, kwargs={}):
+def plot_raster(SL, id_list=None, t_start=None, t_stop=None, display=True, id_color=None, kwargs={}, density=None, decimate=None):
     ''' Same as spikelist.raster_plot() but with pretty plot options
 
         id_color is used to customize colors according to neuron address (for example inhibitory vs. excitatory)
+        density and decimate are passed to raster_plot(): large SpikeLists are
+        drawn as a density image, which is computed again when zooming.
 
         Example:
         >>> id_color = [{'ids':range(124),'color':'blue'},{'ids':range(124,128),'color':'red'}]
@@ -35,13 +38,15 @@ def plot_raster(SL, id_list=None, t_start=None, t_stop=None, display=True, id_co
     kwargs_default.update(kwargs)
 
     if id_color == None:
-        SL.raster_plot(id_list, t_start, t_stop, display, kwargs)
+        SL.raster_plot(id_list, t_start, t_stop, display, kwargs,
+                       density=density, decimate=decimate)
     else:
         h = pylab.axes()
         for i in range(len(id_color)):
             kwargs['color'] = id_color[i]['color']
             SL.id_slice(id_color[i]['ids']).raster_plot(
-                t_start=t_start, t_stop=t_stop, display=h, kwargs=kwargs)
+                t_start=t_start, t_stop=t_stop, display=h, kwargs=kwargs,
+                density=density, decimate=decimate)
         pylab.ylim([SL.id_list().min() - 1, SL.id_list().max() + 1])
 
 
@@ -161,11 +166,26 @@ def composite_plot(SL, id_list=None, t_start=None, t_stop=None, t_start_rate=Non
 STCompositePlot = composite_plot
 
 
-def composite_plot_movie(SL, time_bin=10, t_start=None, t_stop=None, output="animation.mpg", bounds=(0, 5), fps=10, display=True, maxrate=None, ratebin=None, kwargs={}):
-    pylab.ioff()
-    from NeuroTools.plotting import get_display
-    subplot = get_display(display)
-    assert os.system('mencoder') != 32512, "mencoder not found!"
+def composite_plot_movie(SL, time_bin=10, t_start=None, t_stop=None, output="animation.mpg", bounds=None, fps=10, display=None, maxrate=None, ratebin=None, kwargs={}, processes=1, return_frames=False):
+    """
+    Make a movie of the composite plot of SL: every frame adds the spikes of
+    the next time_bin ms to the raster, and shows the rates of the neurons in
+    the ratebin ms starting with the frame.
+
+    The frames are rendered in memory by updating only the new spikes and the
+    rate bars (blitting), and encoded into the file output by ffmpeg
+    (rcParams['animation.ffmpeg_path']) as they are rendered.
+    *processes* is the number of processes rendering the frames, each of
+    them rendering at most 100 frames at a time.
+    If *return_frames* is True, the frames are also returned as an array of
+    shape (frames, height, width, 3). *output* can then be None to skip the
+    encoding.
+    *bounds* and *display* are not used and are deprecated.
+    """
+    if bounds is not None or display is not None:
+        warnings.warn('The bounds and display arguments of '
+                      'composite_plot_movie are not used and will be removed',
+                      DeprecationWarning, stacklevel=2)
     if t_start is None:
         t_start = SL.t_start
     if t_stop is None:
@@ -174,34 +194,127 @@ def composite_plot_movie(SL, time_bin=10, t_start=None, t_stop=None, output="ani
         maxrate = 100
     if ratebin is None:
         ratebin = 100
+    kwargs_raster = {'marker': '|', 'markersize': 2, 'color': 'black',
+                     'ls': ''}
+    kwargs_raster.update(kwargs)
+
+    id_list = SL.id_list()
+    ids, times = SL.convert(format="[ids, times]")
+    order = np.argsort(times, kind='mergesort')
+    ids = ids[order]
+    times = times[order]
+    rows = id_list.searchsorted(ids)
+
+    n_frames = int(np.ceil((t_stop - t_start) / float(time_bin)))
+    if processes is None:
+        processes = spikes.multiprocessing.cpu_count()
+    args = (id_list, ids, times, rows, t_start, t_stop, time_bin, ratebin,
+            maxrate, kwargs_raster)
+    if processes == 1:
+        frames = _iter_composite_movie_frames(*(args + (0, n_frames)))
+    else:
+        chunk = max(min(int(np.ceil(n_frames / float(processes))), 100), 1)
+        tasks = [(k, min(k + chunk, n_frames))
+                 for k in range(0, n_frames, chunk)]
+        frames = (frame for chunk_frames in spikes._imap_tasks(
+            _composite_movie_frames, args, tasks, processes)
+            for frame in chunk_frames)
+
+    encoder = None
+    kept = []
+    try:
+        for frame in frames:
+            if output is not None:
+                if encoder is None:
+                    encoder = _movie_encoder(output, fps, frame.shape)
+                encoder.stdin.write(frame.tostring())
+            if return_frames:
+                kept.append(frame)
+    finally:
+        if encoder is not None:
+            encoder.stdin.close()
+            encoder.wait()
+    if encoder is not None and encoder.returncode != 0:
+        raise RuntimeError('ffmpeg failed to encode {0}'.format(output))
+    if return_frames:
+        return np.array(kept, dtype=np.uint8)
+
+
+def _composite_movie_frames(*args):
+    """
+    Return the array of the frames first to last of composite_plot_movie,
+    see _iter_composite_movie_frames
+    """
+    return np.array(list(_iter_composite_movie_frames(*args)), dtype=np.uint8)
 
-    files = []
-    im = pylab.figure(**kwargs)
-    count = 0
-    idx = 0
-    axS, axR = STCompositePlot(SL, t_start=0, t_stop=time_bin,
-         t_start_rate=0, t_stop_rate=ratebin, kwargs=kwargs)
-    axR.hold(False)
-    axS.hold(False)
-    if t_start != SL.t_start or t_stop != SL.t_stop:
-        spk = SL.time_slice(t_start, t_stop)
-        raise RuntimeError('Not implemented')
-
-    while (t_start < t_stop):
-        STCompositePlot(SL, t_start=0, t_stop=t_start + time_bin, t_start_rate=t_start,
-             t_stop_rate=t_start + ratebin, display=[axS, axR], kwargs=kwargs)
-        axS.set_xlim([0, t_stop])
-        axR.set_xlim([0, maxrate])
-        fname = "_tmp_spikes_%05d.png" % count
-        pylab.savefig(fname)
-        files.append(fname)
-        t_start += time_bin
-        count += 1
-        print('Generated frame {0}'.format(count))
-    command = "mencoder 'mf://_tmp_*.png' -mf type=png:fps=%d -ovc lavc -lavcopts vcodec=wmv2 -oac copy -o %s" % (fps, output)
-    os.system(command)
-    for fname in files:
-        os.remove(fname)
+
+def _iter_composite_movie_frames(id_list, ids, times, rows, t_start, t_stop,
+                                 time_bin, ratebin, maxrate, kwargs, first,
+                                 last):
+    """
+    Render the frames first to last of composite_plot_movie one at a time,
+    the spikes being sorted by time.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    axS = fig.add_axes([0.12, 0.12, 0.57, 0.8])
+    axR = fig.add_axes([0.75, 0.12, 0.20, 0.8])
+    if len(id_list) > 0:
+        axS.set_ylim(id_list.min() - 2, id_list.max() + 2)
+    axS.set_xlim(t_start, t_stop)
+    axS.set_xlabel('Time (ms)')
+    axS.set_ylabel('Neuron')
+    axR.set_ylim(axS.get_ylim())
+    axR.set_xlim(0, maxrate)
+    axR.set_yticks([])
+    axR.grid(True)
+    axR.xaxis.set_major_locator(matplotlib.ticker.MaxNLocator(2))
+    axR.set_xlabel('Frequency (Hz)')
+
+    # Spikes of the previous frames are part of the background
+    start = times.searchsorted(t_start + first * time_bin, 'right')
+    axS.plot(times[:start], ids[:start], **kwargs)
+    new = axS.plot([], [], animated=True, **kwargs)[0]
+    bars = axR.barh(id_list, np.zeros(len(id_list)), linewidth=0,
+                    animated=True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    for k in range(first, last):
+        t = t_start + k * time_bin
+        stop = times.searchsorted(min(t + time_bin, t_stop), 'right')
+        canvas.restore_region(background)
+        new.set_data(times[start:stop], ids[start:stop])
+        axS.draw_artist(new)
+        background = canvas.copy_from_bbox(fig.bbox)
+        start = stop
+
+        window = slice(times.searchsorted(t, 'left'),
+                       times.searchsorted(t + ratebin, 'right'))
+        rates = np.bincount(rows[window],
+                            minlength=len(id_list)) * 1000. / ratebin
+        for bar, rate in zip(bars, rates):
+            bar.set_width(rate)
+            axR.draw_artist(bar)
+        frame = np.frombuffer(canvas.buffer_rgba(), np.uint8)
+        yield frame.reshape(canvas.get_width_height()[::-1] + (4,))[..., :3] \
+            .copy()
+
+
+def _movie_encoder(output, fps, shape):
+    """
+    Start ffmpeg encoding into output the rgb24 frames of the given
+    (height, width, 3) shape written to its stdin
+    """
+    import subprocess
+    height, width = shape[:2]
+    command = [matplotlib.rcParams['animation.ffmpeg_path'], '-y',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '%dx%d' % (width, height), '-r', str(fps), '-i', '-',
+               output]
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
 
 
 def mapSpikeListAddresses(SL, mapping=None):
@@ -241,24 +354,40 @@ def ksi(SL, t_stop=800, pow_freq=None, t_bin=10.):
         t_bin   - time bin for computing population activity and spectrum
         pow_freq- if given, this frequency is taken as the strongest frequency
 
+    See also
+        ksi_spectrum
     """
     #Determine the strongest frequency
     N = len(SL)
 
     if pow_freq == None:
-        psth = SL.time_slice(
-            t_start=0, t_stop=t_stop).spike_histogram(t_bin).mean(axis=0)
+        psth = np.asarray(SL.time_slice(t_start=0, t_stop=t_stop).sparse_spike_histogram(
+            t_bin).sum(axis=0)).ravel() / N
         t = np.arange(0, t_stop * 1e-3, t_bin * 1e-3)
         sp = abs(np.fft.fft(psth).real)
         freq = abs(np.fft.fftfreq(t.shape[-1], d=t_bin * 1e-3))
         pow_freq = freq[1 + np.argmax(sp.real[1:])]
 
-    l_vs = [[] for i in range(len(SL))]
+    return ksi_spectrum(SL, [pow_freq])[0], pow_freq
+
 
-    for i, k in enumerate(SL.id_list()):
-        tm = SL[k].spike_times / 1000  # In seconds
-        l_vs[i] = (tm + .5 / pow_freq) % (1. / pow_freq) - .5 / pow_freq
+def ksi_spectrum(SL, freqs, chunk_size=2 ** 20):
+    """
+    Kuramoto Synchronization Index of all the spikes of SL for every frequency
+    (in Hz) of freqs, i.e. the modulus of the mean of exp(2j * pi * f * t)
+    over the spike times t.
 
-    vs = np.hstack(l_vs) * pow_freq * 2 * np.pi  # Flatten
+    The phases are computed for all the frequencies at once, in chunks of
+    about chunk_size frequency x spike elements.
 
-    return abs(np.sum(np.exp(1j * vs)) / len(vs)), pow_freq
+    Example:
+        >>> freqs = np.arange(1., 100.)
+        >>> pylab.plot(freqs, ksi_spectrum(SL, freqs))
+    """
+    times = SL.spiketrains.columns()[3] * 1e-3  # In seconds
+    freqs = 2 * np.pi * np.atleast_1d(np.asarray(freqs, 'float'))
+    total = np.zeros(len(freqs), 'complex')
+    step = max(chunk_size // len(freqs), 1)
+    for i in range(0, len(times), step):
+        total += np.exp(1j * np.outer(freqs, times[i:i + step])).sum(axis=1)
+    return abs(total) / len(times)
@@ -12,7 +12,8 @@ from .STas import setDefaultMonChannelAddress, setDefaultSeqChannelAddress,\
                  getDefaultMonChannelAddress, getDefaultSeqChannelAddress
 from .STsl import STCreate
 from .spikes import SpikeList, SpikeTrain, merge, merge_spikelists, \
-                   merge_sequencers
+                   merge_sequencers, load_binary, SpikeTrials
+from .stimcache import StimulusCache
 from . import pyST_globals
 import numpy as np
 
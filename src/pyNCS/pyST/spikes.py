@@ -36,7 +36,10 @@ See also NeuroTools.signals.analogs
 
 import os
 import re
+import collections
+import json
 import logging
+import multiprocessing
 import numpy
 import pylab
 import matplotlib
@@ -57,6 +60,103 @@ def load(user_file):
     return SpikeList(data, id_list)
 
 
+def load_binary(path, mmap=True):
+    '''
+    Load a SpikeList saved by SpikeList.save_binary
+
+    Inputs:
+        path - the directory given to save_binary
+        mmap - if True, the spike times are memory-mapped: loading is
+               immediate and only the spikes of the neurons that are accessed
+               are read from the disk
+
+    Examples:
+        >> spklist.save_binary('run0')
+        >> spklist = load_binary('run0')
+    '''
+    with open(os.path.join(path, 'header.json')) as fh:
+        header = json.load(fh)
+    empty_ids = numpy.load(os.path.join(path, 'empty_ids.npy'))
+    chunks = []
+    for k in range(header.get('chunks', 1)):
+        ids = numpy.load(os.path.join(path, _chunk_name('ids', k)))
+        indptr = numpy.load(os.path.join(path, _chunk_name('indptr', k)))
+        if mmap and indptr[-1] > 0:
+            times = numpy.load(os.path.join(path, _chunk_name('times', k)),
+                               mmap_mode='r')
+        else:
+            times = numpy.load(os.path.join(path, _chunk_name('times', k)))
+        chunks.append((ids, indptr[:-1], indptr[1:], times))
+    if len(chunks) == 1:
+        spiketrains = _LazySpikeTrains(*chunks[0])
+    else:
+        spiketrains = _ChunkedSpikeTrains(chunks)
+    dims = header['dims']
+    if isinstance(dims, list):
+        dims = tuple(dims)
+    return SpikeList._from_store(spiketrains, empty_ids, header['t_start'],
+                                 header['t_stop'], dims)
+
+
+def _chunk_name(name, k):
+    '''
+    Return the file name of the array name of the k-th chunk written by
+    SpikeList.save_binary
+    '''
+    if k == 0:
+        return name + '.npy'
+    return '%s_%d.npy' % (name, k)
+
+
+def _exp_cumsum(s, x, span=500.):
+    '''
+    Return the sums of the x[..., j] * exp(s[j] - s[i]) over j < i for the
+    sorted times s (in units of the time constant), i.e. x exponentially
+    filtered just before each time, with cumulative sums. The sums are
+    rescaled every span time constants to avoid overflows.
+    '''
+    filtered = numpy.zeros(x.shape)
+    if len(s) == 0:
+        return filtered
+    bounds = numpy.flatnonzero(numpy.diff((s - s[0]) // span)) + 1
+    bounds = numpy.concatenate(([0], bounds, [len(s)]))
+    # Sums at the beginning of the blocks, over the previous blocks
+    carry = numpy.zeros(x.shape[:-1])
+    for k, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if k > 0:
+            carry *= numpy.exp(s[bounds[k - 1]] - s[start])
+        w = x[..., start:stop] * numpy.exp(s[start:stop] - s[start])
+        cumsum = numpy.cumsum(w, axis=-1)
+        filtered[..., start + 1:stop] = cumsum[..., :-1]
+        filtered[..., start:stop] += carry[..., None]
+        filtered[..., start:stop] *= numpy.exp(s[start] - s[start:stop])
+        carry += cumsum[..., -1]
+    return filtered
+
+
+class _TimeWindow(object):
+    """
+    The [t_start, t_stop] interval of a SpikeTrain. The SpikeTrains of a
+    SpikeList all refer to the window of the SpikeList, so that changing the
+    time parameters of the SpikeList does not need to visit its SpikeTrains.
+    """
+    __slots__ = ('t_start', 't_stop', 'shared')
+
+    def __init__(self, t_start=None, t_stop=None, shared=False):
+        self.t_start = t_start
+        self.t_stop = t_stop
+        self.shared = shared
+
+    def is_complete(self):
+        return self.t_start is not None and self.t_stop is not None
+
+    def __getstate__(self):
+        return self.t_start, self.t_stop, self.shared
+
+    def __setstate__(self, state):
+        self.t_start, self.t_stop, self.shared = state
+
+
 class SpikeTrain(object):
     """
     SpikeTrain(spikes_times, t_start=None, t_stop=None)
@@ -79,6 +179,8 @@ class SpikeTrain(object):
             0.565685424949
     """
 
+    __slots__ = ('_spike_times', '_window')
+
     @property
     def spike_times(self):
         return self._spike_times
@@ -87,6 +189,24 @@ class SpikeTrain(object):
     def spike_times(self, value):
         self._spike_times = numpy.sort(value).astype(numpy.float)
 
+    # The time window may be shared with other SpikeTrains of a SpikeList:
+    # setting a time parameter gives the SpikeTrain its own window.
+    @property
+    def t_start(self):
+        return self._window.t_start
+
+    @t_start.setter
+    def t_start(self, t_start):
+        self._window = _TimeWindow(t_start, self._window.t_stop)
+
+    @property
+    def t_stop(self):
+        return self._window.t_stop
+
+    @t_stop.setter
+    def t_stop(self, t_stop):
+        self._window = _TimeWindow(self._window.t_start, t_stop)
+
     #######################################################################
     ## Constructor and key methods to manipulate the SpikeTrain objects  ##
     #######################################################################
@@ -94,39 +214,32 @@ class SpikeTrain(object):
         """
         Constructor of the SpikeTrain object
         *options*:
-        preextracted: set True for faster construction of the SpikeTrain object if the spike times are already constrained to t_start and t_stop.
         presorted: set True for faster construction of the SpikeTrain object if the spike times are already sorted
 
         See also
-            SpikeTrain
+            SpikeTrain, from_sorted
         """
 
-        self.t_start = t_start
-        self.t_stop = t_stop
-        if not hasattr(spike_times, 'size'): #Assume it is a numpy array
-            self._spike_times = numpy.array(spike_times,numpy.float)
-        else:
-            self._spike_times = spike_times.astype(numpy.float)
-
+        self._window = _TimeWindow(t_start, t_stop)
+        spike_times = numpy.asarray(spike_times, numpy.float)
 
         # We sort the spike_times if necessary. Is slower, but necessary for a lot of methods...
         if not presorted:
-            self._spike_times = numpy.sort(self.spike_times, kind="quicksort")
+            self._spike_times = numpy.sort(spike_times, kind="quicksort")
         else:
             self._spike_times = spike_times
 
-
         # If t_start is not None, we resize the spike_train keeping only
         # the spikes with t >= t_start
         if self.t_start is not None:
-            idx_t_start = numpy.searchsorted(self._spike_times>=self.t_start, True, side='left')
+            idx_t_start = numpy.searchsorted(self._spike_times, self.t_start, side='left')
         else:
             idx_t_start = 0
     
         # If t_stop is not None, we resize the spike_train keeping only
         # the spikes with t <= t_stop
         if self.t_stop is not None:
-            idx_t_stop = numpy.searchsorted(self._spike_times < self.t_stop, True, side='right')
+            idx_t_stop = numpy.searchsorted(self._spike_times, self.t_stop, side='right')
         else:
             idx_t_stop = len(self._spike_times)
         
@@ -159,13 +272,40 @@ class SpikeTrain(object):
                 self.t_start = self._spike_times[0]
             if self.t_stop is None:
                 self.t_stop = self._spike_times[-1]
-            if self._spike_times[-1] > self.t_stop:
-                logging.debug("Spike times are greater than t_stop, clipping")
-                self._spike_times = self._spike_times[self._spike_times<t_stop]
-            if self._spike_times[0] < self.t_start:
-                logging.debug("Spike times are smaller than t_stop, clipping")
-                self._spike_times = self._spike_times[self._spike_times>=t_start]
 
+        self.__check_time_parameters()
+
+    @classmethod
+    def from_sorted(cls, spike_times, t_start, t_stop):
+        """
+        Fast constructor of a SpikeTrain from spike times that are already
+        sorted. If spike_times is a float numpy array it is not copied: the
+        SpikeTrain holds a view on it, restricted to [t_start, t_stop] with
+        two binary searches.
+
+        Inputs:
+            spike_times - sorted array of spike times (in milliseconds)
+            t_start     - beginning of the SpikeTrain
+            t_stop      - end of the SpikeTrain
+
+        Examples:
+            >> st = SpikeTrain.from_sorted(numpy.cumsum(isi), 0., 1000.)
+
+        See also
+            SpikeTrain
+        """
+        if t_start is None or t_stop is None:
+            return cls(spike_times, t_start, t_stop, presorted=True)
+        spike_times = numpy.asarray(spike_times, numpy.float)
+        st = cls.__new__(cls)
+        st._window = _TimeWindow(t_start, t_stop)
+        st._spike_times = spike_times[
+            spike_times.searchsorted(t_start, 'left'):
+            spike_times.searchsorted(t_stop, 'right')]
+        st.__check_time_parameters()
+        return st
+
+    def __check_time_parameters(self):
         if self.t_start > self.t_stop:
             raise Exception("Incompatible time interval : t_start = %s, t_stop = %s" %
                  (self.t_start, self.t_stop))
@@ -181,6 +321,11 @@ class SpikeTrain(object):
             if self._spike_times[0] < 0:
                 raise ValueError("Spike times must not be negative")
 
+    def __getstate__(self):
+        return self._spike_times, self._window
+
+    def __setstate__(self, state):
+        self._spike_times, self._window = state
 
     def __str__(self):
         return str(self.spike_times)
@@ -221,7 +366,7 @@ class SpikeTrain(object):
         """
         Return a copy of the SpikeTrain object
         """
-        return SpikeTrain(self.spike_times, self.t_start, self.t_stop)
+        return SpikeTrain.from_sorted(self.spike_times.copy(), self.t_start, self.t_stop)
 
     def duration(self):
         """
@@ -542,7 +687,7 @@ class SpikeTrain(object):
         else:
             self.t_stop = t_stop
 
-        self.spike_times += offset
+        self._spike_times = self._spike_times + offset
 
     def time_slice(self, t_start, t_stop):
         """
@@ -560,9 +705,7 @@ class SpikeTrain(object):
             >> spk.t_stop
                 100
         """
-        spikes = numpy.extract((self.spike_times >= t_start) & (
-            self.spike_times <= t_stop), self.spike_times)
-        return SpikeTrain(spikes, t_start, t_stop)
+        return SpikeTrain.from_sorted(self.spike_times, t_start, t_stop)
 
     #def interval_slice(self, interval):
     #    """
@@ -621,7 +764,7 @@ class SpikeTrain(object):
         is substracted to spike_times, t_start and t_stop
         """
         if self.t_start != 0:
-            self.spike_times -= self.t_start
+            self._spike_times = self._spike_times - self.t_start
             self.t_stop -= self.t_start
             self.t_start = 0.0
 
@@ -643,24 +786,52 @@ class SpikeTrain(object):
             return abs(nspk_1 - nspk_2)
         elif cost > 1e9:
             return nspk_1 + nspk_2
-        scr = numpy.zeros((nspk_1 + 1, nspk_2 + 1))
-        scr[:, 0] = numpy.arange(0, nspk_1 + 1)
-        scr[0, :] = numpy.arange(0, nspk_2 + 1)
-
-        if nspk_1 > 0 and nspk_2 > 0:
-            for i in xrange(1, nspk_1 + 1):
-                for j in xrange(1, nspk_2 + 1):
-                    scr[i, j] = min(scr[i - 1, j] + 1, scr[i, j - 1] + 1)
-                    scr[i, j] = min(scr[i, j], scr[i - 1, j - 1] + cost *
-                        abs(self.spike_times[i - 1] - spktrain.spike_times[j - 1]))
-        return scr[nspk_1, nspk_2]
-
-    def distance_vanrossum(self, spktrain, tc=5., dt=0.1):
+        # The score matrix is computed row by row. Within a row,
+        # scr[i, j] = min(c[j], scr[i, j - 1] + 1) where c[j] does not depend
+        # on the row, so that scr[i, j] = j + min(c[k] - k, k <= j)
+        spk_2 = spktrain.spike_times
+        j = numpy.arange(0, nspk_2 + 1)
+        scr = j.astype(numpy.float)
+        c = numpy.empty(nspk_2 + 1)
+        for i, spk in enumerate(self.spike_times.tolist()):
+            c[0] = i + 1
+            c[1:] = numpy.minimum(scr[1:] + 1,
+                                  scr[:-1] + cost * numpy.abs(spk - spk_2))
+            scr = numpy.minimum.accumulate(c - j) + j
+        return scr[nspk_2]
+
+    def distance_vanrossum(self, spktrain, tc=5., dt=None):
         """
         Returns the van Rossum metric of the two spike trians.
-        dt - time bins to calculate the exponentials.
+        See M. C. W. van Rossum,
+            A novel spike distance,
+            Neural Computation, 13(4):751-763, 2001
+
+        The distance is computed exactly, without time grid: the integral of
+        the squared difference of the exponentially filtered spike trains is
+        a sum of exponentials of the spike time differences, obtained with
+        cumulative sums over the merged spike times (Houghton and Kreuz, 2012).
+
         tc - time constant / cost of the exponentials.
+        dt - if given, the former estimate on time bins of dt is returned
+             instead, where only the last spike is filtered.
         """
+        if dt is not None:
+            return self.__distance_vanrossum_grid(spktrain, tc, dt)
+        nspk_1 = len(self)
+        spike_times = numpy.concatenate((self.spike_times, spktrain.spike_times))
+        order = numpy.argsort(spike_times, kind='mergesort')
+        first = order < nspk_1
+        # Filtered spike trains just before each spike, and sums of the kernel
+        # between spikes of the same train and of different trains
+        f1, f2 = _exp_cumsum(spike_times[order] / tc,
+                             numpy.array([first, ~first], float))
+        same = f1[first].sum() + f2[~first].sum()
+        cross = f2[first].sum() + f1[~first].sum()
+        vrm = len(spike_times) / 2. + same - cross
+        return numpy.sqrt(max(vrm, 0.))
+
+    def __distance_vanrossum_grid(self, spktrain, tc, dt):
         n = int((self.t_stop - self.t_start) / dt)
         t = numpy.linspace(self.t_start, self.t_stop, n)
         z1 = numpy.zeros(n)
@@ -701,6 +872,8 @@ class SpikeTrain(object):
 
 
 class emptySpikeTrain(SpikeTrain):
+    __slots__ = ()
+
     def __init__(self):
         super(emptySpikeTrain, self).__init__([])
         self.t_stop = 0
@@ -738,40 +911,621 @@ def merge(*spiketrains):
         >> a.t_stop
             500
     """
-    new_st = SpikeTrain([])
-
-    for st in spiketrains:
-        new_st.spike_times = numpy.insert(
-                          new_st.spike_times,
-                          new_st.spike_times.searchsorted(st.spike_times),
-                          st.spike_times)
-        new_st.t_start = min(new_st.t_start, st.t_start)
-        new_st.t_stop = max(new_st.t_stop, st.t_stop)
+    # The sorted spike times of all the trains are merged in one pass
+    spike_times = numpy.sort(numpy.concatenate(
+        [numpy.zeros(0)] + [st.spike_times for st in spiketrains]),
+        kind='mergesort')
+    t_start = min([0] + [st.t_start for st in spiketrains])
+    t_stop = max([0.1] + [st.t_stop for st in spiketrains])
 
-    return new_st
+    return SpikeTrain.from_sorted(spike_times, t_start, t_stop)
 
 
 def merge_spikelists(*lspikelist):
-    #create stim sequence
-    stStim = SpikeList([], [])
+    """
+    Merge SpikeLists into a new SpikeList starting at 0 and ending with the
+    last spike. The SpikeTrains of the ids found in several SpikeLists are
+    merged.
 
-    #workaround for NeuroTools bug
-    tt = []
-    tmarray = numpy.array([[], []], dtype='float')
-    adarray = numpy.array([], dtype='float')
+    Examples:
+        >> stim = merge_spikelists(stim_exc, stim_inh)
 
-    #transition inumpyuts
-    for i, stStimPre in enumerate(lspikelist):
-        tt.append(stStimPre.raw_data())
-        adarray = numpy.concatenate([stStimPre.id_list(), adarray])
+    See also
+        SpikeList.merge, merge_sequencers
+    """
+    ids, starts, stops, times = _merge_columns(
+        [sl.spiketrains.columns() for sl in lspikelist])
+    id_list = numpy.unique(numpy.concatenate(
+        [numpy.zeros(0)] + [sl.id_list() for sl in lspikelist]))
+    if len(times) > 0:
+        t_stop = times.max()
+    else:
+        t_stop = None
 
-    #merge
-    tmarray = numpy.fliplr(numpy.vstack(tt))
-    adarray = numpy.sort(numpy.unique(adarray))
+    return SpikeList._from_columns(
+        ids, starts, stops, times, id_list, t_start=0.0, t_stop=t_stop)
 
-    stStim = SpikeList(
-        tmarray, adarray, t_start=0.0, t_stop=max(tmarray[:, 1]))
-    return stStim
+
+def _run_index(starts, stops):
+    """
+    Return the indices of a times array covered by the runs
+    times[starts[i]:stops[i]], concatenated in run order.
+    """
+    lengths = stops - starts
+    indptr = numpy.concatenate(([0], numpy.cumsum(lengths)))
+    return numpy.arange(indptr[-1]) - numpy.repeat(indptr[:-1] - starts, lengths)
+
+
+def _merge_columns(columns):
+    """
+    Merge columnar spike stores (ids, starts, stops, times), see
+    _LazySpikeTrains, into a single compact one.
+
+    The runs are placed id by id in the merged times array. Only the runs of
+    ids present in several stores need to be merged in time, which is done
+    with one stable sort restricted to their spikes.
+    """
+    columns = [c for c in columns if len(c[0]) > 0]
+    if len(columns) == 0:
+        return numpy.zeros(0), numpy.zeros(0, int), numpy.zeros(0, int), \
+               numpy.zeros(0)
+    ids = numpy.unique(numpy.concatenate([c[0] for c in columns]))
+    counts = numpy.zeros(len(ids), int)
+    n_runs = numpy.zeros(len(ids), int)
+    # Position of the run of every store within the merged run of its id
+    ranks, offsets = [], []
+    for c_ids, c_starts, c_stops, c_times in columns:
+        rank = ids.searchsorted(c_ids)
+        ranks.append(rank)
+        offsets.append(counts[rank])
+        counts[rank] += c_stops - c_starts
+        n_runs[rank] += 1
+    stops = numpy.cumsum(counts)
+    starts = stops - counts
+
+    times = numpy.empty(stops[-1])
+    for (c_ids, c_starts, c_stops, c_times), rank, offset in zip(
+            columns, ranks, offsets):
+        dest = starts[rank] + offset
+        times[_run_index(dest, dest + c_stops - c_starts)] = \
+            c_times[_run_index(c_starts, c_stops)]
+
+    shared = n_runs > 1
+    if numpy.any(shared):
+        idx = _run_index(starts[shared], stops[shared])
+        run = numpy.repeat(numpy.arange(shared.sum()), counts[shared])
+        times[idx] = times[idx][numpy.lexsort((times[idx], run))]
+    return ids, starts, stops, times
+
+
+class _LazySpikeTrains(object):
+    """
+    Dictionary-like container holding the SpikeTrains of a SpikeList.
+
+    Spike times are stored in columnar form: the spikes of cell ids[i] are
+    times[starts[i]:stops[i]], in increasing order, and ids is sorted. The
+    runs of a container obtained by slicing another one are views on the
+    times array of the original: they follow each other in the same order
+    but need not be contiguous. columns() always returns contiguous runs.
+    SpikeTrain objects are only created when an id is accessed. Ids added by
+    SpikeList.complete are kept implicitly empty, and all map to a single
+    shared emptySpikeTrain.
+    """
+    def __init__(self, ids=None, starts=None, stops=None, times=None):
+        if ids is None:
+            ids = numpy.zeros(0)
+            starts = numpy.zeros(0, int)
+            stops = numpy.zeros(0, int)
+            times = numpy.zeros(0)
+        self._ids = ids
+        self._starts = starts
+        self._stops = stops
+        self._times = times
+        self._empty_ids = numpy.zeros(0)
+        self._empty_train = None
+        # SpikeTrains that have been accessed or set, by id
+        self._trains = {}
+        # For trains created from the store: the array they were given
+        self._pristine = {}
+        self._keys = None
+        # ids[i] + 1j * times of the runs, see search()
+        self._search_keys = None
+        # Time window shared by all the SpikeTrains of the container
+        self.window = _TimeWindow(shared=True)
+
+    @property
+    def t_start(self):
+        return self.window.t_start
+
+    @property
+    def t_stop(self):
+        return self.window.t_stop
+
+    @staticmethod
+    def _index(array, id):
+        try:
+            i = numpy.searchsorted(array, id)
+        except (TypeError, ValueError):
+            return -1
+        if i < len(array) and array[i] == id:
+            return i
+        return -1
+
+    def empty_train(self):
+        if self._empty_train is None:
+            self._empty_train = emptySpikeTrain()
+            if self.window.is_complete():
+                self._empty_train._window = self.window
+            elif self.t_start is not None:
+                self._empty_train.t_start = self.t_start
+            elif self.t_stop is not None:
+                self._empty_train.t_stop = self.t_stop
+        return self._empty_train
+
+    def __getitem__(self, id):
+        try:
+            return self._trains[id]
+        except KeyError:
+            pass
+        i = self._index(self._ids, id)
+        if i >= 0:
+            return self._create(
+                id, self._times[self._starts[i]:self._stops[i]])
+        if self._index(self._empty_ids, id) >= 0:
+            return self.empty_train()
+        raise KeyError(id)
+
+    def _create(self, id, spike_times):
+        """
+        Create the SpikeTrain of id from its sorted spike times in the store
+        """
+        st = SpikeTrain.from_sorted(spike_times, self.t_start, self.t_stop)
+        if self.window.is_complete():
+            st._window = self.window
+        self._trains[id] = st
+        self._pristine[id] = st._spike_times
+        return st
+
+    def __setitem__(self, id, spktrain):
+        if not id in self:
+            self._keys = None
+        if self.window.is_complete():
+            spktrain = self._adopt(spktrain)
+        self._trains[id] = spktrain
+        self._pristine.pop(id, None)
+
+    def __contains__(self, id):
+        return (id in self._trains or
+                self._index(self._ids, id) >= 0 or
+                self._index(self._empty_ids, id) >= 0)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """
+        Return the sorted array of all the ids in the container
+        """
+        if self._keys is None:
+            keys = numpy.concatenate((self._ids, self._empty_ids))
+            if len(self._trains) > 0:
+                keys = numpy.concatenate((keys, numpy.array(self._trains.keys())))
+            self._keys = numpy.unique(keys)
+        return self._keys
+
+    def itervalues(self):
+        for id in self.keys():
+            yield self[id]
+
+    def iteritems(self):
+        for id in self.keys():
+            yield id, self[id]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def update(self, items):
+        for id, spktrain in items:
+            self[id] = spktrain
+
+    def pop(self, id):
+        spktrain = self[id]
+        self.columns()
+        self._trains.pop(id, None)
+        self._pristine.pop(id, None)
+        i = self._index(self._ids, id)
+        if i >= 0:
+            self._set_columns(numpy.delete(self._ids, i),
+                              numpy.delete(self._starts, i),
+                              numpy.delete(self._stops, i),
+                              self._times)
+        i = self._index(self._empty_ids, id)
+        if i >= 0:
+            self._empty_ids = numpy.delete(self._empty_ids, i)
+        self._keys = None
+        return spktrain
+
+    def complete(self, id_list):
+        """
+        Register the ids of id_list that are not yet present as empty
+        """
+        missing = numpy.setdiff1d(numpy.asarray(id_list), self.keys())
+        if len(missing) > 0:
+            self._empty_ids = numpy.union1d(self._empty_ids, missing)
+            self._keys = None
+
+    def materialized(self):
+        """
+        Return the SpikeTrain objects that have been created so far
+        """
+        sts = self._trains.values()
+        if self._empty_train is not None:
+            sts.append(self._empty_train)
+        return sts
+
+    def set_t_start(self, t_start):
+        attached = self.window.is_complete()
+        self.window.t_start = t_start
+        if not attached:
+            self._attach()
+
+    def set_t_stop(self, t_stop):
+        attached = self.window.is_complete()
+        self.window.t_stop = t_stop
+        if not attached:
+            self._attach()
+
+    def _attach(self):
+        """
+        Make the SpikeTrains created while the time window was not fully
+        defined refer to it. Once this is done, changing the window only
+        costs an assignment.
+        """
+        if self.window.is_complete():
+            for id, st in self._trains.items():
+                self._trains[id] = self._adopt(st)
+            if self._empty_train is not None:
+                self._empty_train._window = self.window
+
+    def _adopt(self, spktrain):
+        """
+        Make spktrain refer to the time window of the container. A SpikeTrain
+        of another SpikeList is left untouched and replaced by a view of it.
+        """
+        if spktrain._window.shared and not spktrain._window is self.window:
+            spktrain = type(spktrain).from_sorted(
+                spktrain._spike_times, spktrain.t_start, spktrain.t_stop)
+        spktrain._window = self.window
+        return spktrain
+
+    def columns(self):
+        """
+        Return the columnar representation (ids, starts, stops, times) of the
+        container. Implicitly empty ids are not part of it.
+
+        SpikeTrains which were set or modified since they were created are
+        first written back to the store, and the runs of a sliced container
+        are copied into a new contiguous array.
+        """
+        ids, starts, stops, times = self.runs()
+        if not (len(ids) == 0 and len(times) == 0 or
+                starts[0] == 0 and stops[-1] == len(times) and
+                numpy.all(starts[1:] == stops[:-1])):
+            self._set_columns(ids, starts, stops, times)
+        return self._ids, self._starts, self._stops, self._times
+
+    def runs(self):
+        """
+        Same as columns(), but the runs may be views on a larger times array
+        """
+        dirty = [id for id, st in self._trains.iteritems()
+                 if not self._pristine.get(id) is st._spike_times]
+        if len(dirty) > 0:
+            self._consolidate(dirty)
+        return self._ids, self._starts, self._stops, self._times
+
+    def search(self, t, side='left'):
+        """
+        Return for every run the index in the times array where t would be
+        inserted to keep it sorted, as numpy.searchsorted.
+
+        The spikes are searched in the array of the complex numbers
+        id + 1j * time, which is sorted along the times array, so that all the
+        runs are searched with one searchsorted.
+        """
+        ids, starts, stops, times = self.runs()
+        if self._search_keys is None:
+            ids, starts, stops, times = self.columns()
+            self._search_keys = numpy.repeat(ids, stops - starts) + 1j * times
+        idx = self._search_keys.searchsorted(ids + 1j * t, side)
+        return numpy.clip(idx, starts, stops)
+
+    def _view(self, ids, starts, stops, empty_ids):
+        """
+        Return a container holding the given runs of the times array of this
+        container, without copying it
+        """
+        times = self._times
+        new = _LazySpikeTrains(ids, starts, stops, times)
+        new._search_keys = self._search_keys
+        new._empty_ids = empty_ids
+        return new
+
+    def time_slice(self, t_start, t_stop):
+        """
+        Return a container with the spikes between t_start and t_stop, made of
+        views on the times array of this container
+        """
+        lo = self.search(t_start, 'left')
+        hi = self.search(t_stop, 'right')
+        return self._view(self._ids, lo, hi, self._empty_ids)
+
+    def id_slice(self, id_list):
+        """
+        Return a container with the ids of id_list found in this container,
+        made of views on its times array
+        """
+        ids, starts, stops, times = self.runs()
+        i = numpy.in1d(ids, id_list)
+        return self._view(ids[i], starts[i], stops[i],
+                          numpy.intersect1d(self._empty_ids, id_list))
+
+    def _consolidate(self, dirty):
+        d_ids = numpy.array(dirty, dtype=self._ids.dtype)
+        d_times = [self._trains[id].spike_times for id in dirty]
+        d_lengths = numpy.array([len(t) for t in d_times], int)
+        keep = numpy.logical_not(numpy.in1d(self._ids, d_ids))
+        d_starts = len(self._times) + numpy.concatenate(
+            ([0], numpy.cumsum(d_lengths)[:-1]))
+        ids = numpy.concatenate((self._ids[keep], d_ids))
+        starts = numpy.concatenate((self._starts[keep], d_starts))
+        stops = numpy.concatenate((self._stops[keep], d_starts + d_lengths))
+        times = numpy.concatenate([self._times] + d_times)
+        order = numpy.argsort(ids, kind='mergesort')
+        self._set_columns(ids[order], starts[order], stops[order], times)
+
+    def _set_columns(self, ids, starts, stops, times):
+        """
+        Store the runs in a new compact times array, and point the
+        SpikeTrains already created to it. Modified SpikeTrains must have been
+        written back with columns() before.
+        """
+        lengths = stops - starts
+        self._times = times[_run_index(starts, stops)].astype(
+            numpy.float, copy=False)
+        self._stops = numpy.cumsum(lengths)
+        self._starts = self._stops - lengths
+        self._ids = ids
+        self._search_keys = None
+        self._pristine = {}
+        for id, st in self._trains.items():
+            i = self._index(self._ids, id)
+            if i < 0:
+                continue
+            if not isinstance(st, emptySpikeTrain):
+                st._spike_times = self._times[self._starts[i]:self._stops[i]]
+            elif self._stops[i] > self._starts[i]:
+                # Spikes were merged in: created again on access
+                del self._trains[id]
+                continue
+            self._pristine[id] = st._spike_times
+
+    def time_offset(self, offset):
+        """
+        Shift all the spike times by offset
+        """
+        ids, starts, stops, times = self.columns()
+        self._set_columns(ids, starts, stops, times + offset)
+
+    def id_offset(self, offset):
+        """
+        Shift all the ids by offset
+        """
+        ids, starts, stops, times = self.columns()
+        self._ids = ids + offset
+        self._empty_ids = self._empty_ids + offset
+        self._trains = dict((id + offset, st)
+                            for id, st in self._trains.iteritems())
+        self._pristine = dict((id + offset, a)
+                              for id, a in self._pristine.iteritems())
+        self._keys = None
+        self._search_keys = None
+
+    def merge(self, ids, starts, stops, times):
+        """
+        Merge the runs of another columnar store into the container
+        """
+        self._set_columns(*_merge_columns(
+            [self.columns(), (ids, starts, stops, times)]))
+        self._empty_ids = numpy.setdiff1d(self._empty_ids, self._ids)
+        self._keys = None
+
+    def time_bounds(self):
+        """
+        Return the arrays of the t_start and t_stop values of all the
+        SpikeTrains. Those which have not been created yet take the time
+        parameters of the container, or infer them from their spikes.
+        """
+        lazy = numpy.logical_not(numpy.in1d(
+            self._ids, numpy.array(self._trains.keys(), dtype=self._ids.dtype)))
+        starts, stops = self._starts[lazy], self._stops[lazy]
+        lengths = stops - starts
+        # Runs left empty by a time slice are inferred as SpikeTrain([])
+        first = numpy.zeros(len(lengths))
+        last = numpy.zeros(len(lengths))
+        first[lengths > 0] = self._times[starts[lengths > 0]]
+        last[lengths > 0] = self._times[stops[lengths > 0] - 1]
+        if self.t_start is None:
+            start_times = first
+        else:
+            start_times = numpy.repeat(self.t_start, len(first))
+        if self.t_stop is None:
+            stop_times = numpy.where(lengths > 1, last, first + 0.1)
+        else:
+            stop_times = numpy.repeat(self.t_stop, len(last))
+        sts = self._trains.values()
+        if len(self._empty_ids) > 0:
+            sts.append(self.empty_train())
+        start_times = numpy.concatenate(
+            (start_times, [st.t_start for st in sts]))
+        stop_times = numpy.concatenate(
+            (stop_times, [st.t_stop for st in sts]))
+        return start_times, stop_times
+
+    def copy(self):
+        """
+        Return a new container owning a copy of the spike times
+        """
+        ids, starts, stops, times = self.runs()
+        has_spikes = stops > starts
+        new = _LazySpikeTrains()
+        new._set_columns(ids[has_spikes], starts[has_spikes],
+                         stops[has_spikes], times)
+        new._empty_ids = numpy.union1d(self._empty_ids, ids[~has_spikes])
+        new.window = _TimeWindow(self.t_start, self.t_stop, shared=True)
+        return new
+
+
+class _ChunkedSpikeTrains(_LazySpikeTrains):
+    """
+    Container of SpikeTrains whose spikes are split in several columnar
+    stores (ids, starts, stops, times), such as the chunks of a recording
+    saved with SpikeList.save_binary(append=True). An id may have a run in
+    every chunk.
+
+    The SpikeTrain of an id is assembled from its runs when it is accessed,
+    so that the times arrays of the chunks can stay memory-mapped. The chunks
+    are merged into a single store by the first operation on all the spikes
+    (columns, runs, time_bounds).
+    """
+    def __init__(self, chunks):
+        _LazySpikeTrains.__init__(self, numpy.unique(numpy.concatenate(
+            [ids for ids, starts, stops, times in chunks])))
+        self._chunks = chunks
+
+    def __getitem__(self, id):
+        if self._chunks is None or id in self._trains:
+            return _LazySpikeTrains.__getitem__(self, id)
+        runs = []
+        for ids, starts, stops, times in self._chunks:
+            i = self._index(ids, id)
+            if i >= 0:
+                runs.append(times[starts[i]:stops[i]])
+        if len(runs) == 0:
+            return _LazySpikeTrains.__getitem__(self, id)
+        if len(runs) == 1:
+            return self._create(id, runs[0])
+        return self._create(id, numpy.sort(numpy.concatenate(runs),
+                                           kind='mergesort'))
+
+    def runs(self):
+        if self._chunks is not None:
+            # The SpikeTrains already created keep their arrays, which are
+            # still recognized as unmodified
+            self._ids, self._starts, self._stops, self._times = \
+                _merge_columns(self._chunks)
+            self._chunks = None
+            self._search_keys = None
+        return _LazySpikeTrains.runs(self)
+
+    def time_bounds(self):
+        self.runs()
+        return _LazySpikeTrains.time_bounds(self)
+
+
+def _correlogram(spike_times_1, spike_times_2, time_bin, max_lag):
+    """
+    Return the counts of the lags spike_times_2[j] - spike_times_1[i] within
+    [-max_lag, max_lag], in bins of time_bin centered on the multiples of
+    time_bin. The spikes of spike_times_2 close to each spike of
+    spike_times_1 are found with a binary search, no binning of the spike
+    trains is needed.
+    """
+    n_side = int(numpy.ceil(float(max_lag) / time_bin))
+    lo = spike_times_2.searchsorted(spike_times_1 - max_lag, 'left')
+    hi = spike_times_2.searchsorted(spike_times_1 + max_lag, 'right')
+    lags = spike_times_2[_run_index(lo, hi)] - numpy.repeat(spike_times_1, hi - lo)
+    bins = numpy.floor(lags / time_bin + 0.5).astype(int) + n_side
+    return numpy.bincount(bins, minlength=2 * n_side + 1)
+
+
+def _correlogram_rows(spike_times, time_bin, max_lag, pairs):
+    return [_correlogram(spike_times[i], spike_times[j], time_bin, max_lag)
+            for i, j in pairs]
+
+
+def _distance_rows(metric, kwargs, rows, columns, row_indices, symmetric):
+    """
+    Compute the distances between rows[i] for i in row_indices and the
+    columns, or only the columns j > i if symmetric.
+    """
+    distance = getattr(SpikeTrain, 'distance_' + metric)
+    values = []
+    for i in row_indices:
+        start = i + 1 if symmetric else 0
+        values.append([distance(rows[i], columns[j], **kwargs)
+                       for j in xrange(start, len(columns))])
+    return row_indices, values
+
+
+# Arguments shared by the tasks of the worker processes, see _map_tasks
+_worker_args = None
+
+
+def _worker_init(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _worker_task(task):
+    return task[0](*(_worker_args + task[1:]))
+
+
+def _imap_tasks(function, args, tasks, processes):
+    """
+    Iterate over the function(*(args + task)) for the tasks, in order, as
+    _map_tasks. At most processes + 1 results are pending, so that they can
+    be consumed as they are computed without keeping them all in memory.
+    """
+    if processes == 1:
+        for task in tasks:
+            yield function(*(args + task))
+        return
+    pool = multiprocessing.Pool(processes, _worker_init, args)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_worker_task,
+                                            ((function,) + task,)))
+            if len(pending) > processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _map_tasks(function, args, tasks, processes):
+    """
+    Return the list of function(*(args + task)) for the tasks, computed by a
+    pool of processes. The common arguments args are sent once to each
+    worker. If processes is 1, everything is computed in this process.
+    """
+    if processes == 1:
+        return [function(*(args + task)) for task in tasks]
+    pool = multiprocessing.Pool(processes, _worker_init, args)
+    try:
+        return pool.map(_worker_task, [(function,) + task for task in tasks])
+    finally:
+        pool.close()
+        pool.join()
 
 
 class SpikeList(object):
@@ -810,36 +1564,40 @@ class SpikeList(object):
         if isinstance(spikes, SpikeList):
             id_list = spikes.id_list()
             spikes = numpy.transpose(spikes.convert("[ids, times]"))
-        self._t_start = t_start
-        self._t_stop = t_stop
         self.dimensions = dims
-        self.spiketrains = {}
+        self.spiketrains = _LazySpikeTrains()
         id_list = numpy.sort(id_list)
-        id_set = set(id_list) #For fast membership testing
-
-        # Implementaion base on pure Numpy arrays, that seems to be faster for
-        # large spike files. Still not very efficient in memory, because we are
-        # not
-        ## using a generator to build the SpikeList...
 
+        # The spikes are stored in columnar form, grouped by id and sorted in
+        # time. SpikeTrain objects are only created when they are accessed.
         if not hasattr(spikes, 'size'):  # is not an array:
             spikes = numpy.array(spikes, 'float')
         N = len(spikes)
 
         if N > 0:
+            keep = numpy.in1d(spikes[:, 0], id_list)
+            if t_start is not None:
+                keep &= spikes[:, 1] >= t_start
+            if t_stop is not None:
+                keep &= spikes[:, 1] <= t_stop
+            spikes = spikes[keep]
             #sorting for fast array->dictionary
-            spikes = spikes[numpy.argsort(spikes[:, 0],)]
-
-            logging.debug("sorted spikes[:10,:] = %s" % str(spikes[:10, :]))
+            order = numpy.lexsort((spikes[:, 1], spikes[:, 0]))
+            ids = spikes[order, 0]
+            times = spikes[order, 1].astype(numpy.float)
+            if len(times) > 0 and times.min() < 0:
+                raise ValueError("Spike times must not be negative")
 
-            break_points = numpy.where(numpy.diff(spikes[:, 0]) > 0)[0] + 1
-            break_points = numpy.concatenate(([0], break_points))
-            break_points = numpy.concatenate((break_points, [N]))
+            logging.debug("sorted spikes[:10,:] = %s" % str(spikes[order[:10], :]))
 
-            for idx in xrange(len(break_points) - 1):
-                id = spikes[break_points[idx], 0]
-                if id in id_set:
-                    self.spiketrains[id] = SpikeTrain(spikes[break_points[idx]:break_points[idx + 1], 1], self.t_start, self.t_stop, presorted = False)
+            break_points = numpy.where(numpy.diff(ids) > 0)[0] + 1
+            starts = numpy.concatenate(([0], break_points)).astype(int)
+            stops = numpy.concatenate((break_points, [len(ids)])).astype(int)
+            if len(ids) > 0:
+                self.spiketrains = _LazySpikeTrains(
+                    ids[starts], starts, stops, times)
+        self.spiketrains.set_t_start(t_start)
+        self.spiketrains.set_t_stop(t_stop)
 
         self.complete(id_list)
 
@@ -850,33 +1608,42 @@ class SpikeList(object):
 
     @property
     def t_start(self):
-        return self._t_start
+        return self.spiketrains.t_start
 
     @t_start.setter
     def t_start(self, t_start):
-        self._t_start = t_start
-        for st in self:
-            st.t_start = t_start
+        self.spiketrains.set_t_start(t_start)
 
     @property
     def t_stop(self):
-        return self._t_stop
+        return self.spiketrains.t_stop
 
     @t_stop.setter
     def t_stop(self, t_stop):
-        self._t_stop = t_stop
-        for st in self:
-            st.t_stop = t_stop
+        self.spiketrains.set_t_stop(t_stop)
 
     def __del__(self):
         pass
 
     def filter_duplicates(self, time_window = .01):
-        for st in self:
-            isi = st.isi()
-            if not isinstance(st, emptySpikeTrain):
-                st.spike_times = numpy.delete(
-                    st.spike_times, numpy.nonzero(isi < time_window)[0])
+        """
+        Remove the spikes that follow the previous spike of the same cell by
+        less than time_window (ms).
+        """
+        ids, starts, stops, times = self.spiketrains.columns()
+        if len(times) < 2:
+            return
+        isi_small = numpy.diff(times) < time_window
+        # Spikes at the end of a run are compared with the next run
+        isi_small[stops[stops < len(times)] - 1] = False
+        lengths = stops - starts
+        keep = numpy.ones(len(times), bool)
+        keep[:-1] = numpy.logical_not(isi_small)
+        run_of = numpy.repeat(numpy.arange(len(ids)), lengths)
+        new_lengths = numpy.bincount(run_of[keep], minlength=len(ids))
+        new_stops = numpy.cumsum(new_lengths)
+        self.spiketrains._set_columns(
+            ids, new_stops - new_lengths, new_stops, times[keep])
 
     def id_list(self):
         """
@@ -887,16 +1654,47 @@ class SpikeList(object):
             >> spklist.id_list()
                 [0,1,2,3,....,9999]
         """
-        #return numpy.array(self.spiketrains.keys(), int)
-        return numpy.array(numpy.sort(self.spiketrains.keys()))
+        return numpy.array(self.spiketrains.keys())
 
     def copy(self):
         """
         Return a copy of the SpikeList object
         """
         spklist = SpikeList([], [], self.t_start, self.t_stop, self.dimensions)
-        for id in self.id_list():
-            spklist.append(id, self.spiketrains[id])
+        spklist.spiketrains = self.spiketrains.copy()
+        return spklist
+
+    @classmethod
+    def _from_columns(cls, ids, starts, stops, times, id_list=[],
+                      t_start=None, t_stop=None, dims=None):
+        """
+        Create a SpikeList from a columnar spike store (see _LazySpikeTrains)
+        without sorting the spikes again. The spike times must lie within
+        [t_start, t_stop].
+        """
+        has_spikes = stops > starts
+        if numpy.all(has_spikes):
+            spiketrains = _LazySpikeTrains(ids, starts, stops, times)
+        else:
+            spiketrains = _LazySpikeTrains()
+            spiketrains._set_columns(ids[has_spikes], starts[has_spikes],
+                                     stops[has_spikes], times)
+        return cls._from_store(spiketrains, numpy.union1d(id_list, ids),
+                               t_start, t_stop, dims)
+
+    @classmethod
+    def _from_store(cls, spiketrains, id_list=[], t_start=None, t_stop=None,
+                    dims=None):
+        """
+        Create a SpikeList holding the container spiketrains (see
+        _LazySpikeTrains). The spike times must lie within [t_start, t_stop].
+        """
+        spklist = cls([], [], t_start, t_stop, dims)
+        spiketrains.window = spklist.spiketrains.window
+        spklist.spiketrains = spiketrains
+        spklist.complete(id_list)
+        if len(spklist) > 0 and (t_start is None or t_stop is None):
+            spklist.__calc_startstop()
         return spklist
 
     def __calc_startstop(self):
@@ -906,27 +1704,18 @@ class SpikeList(object):
         all the spikeTrains within the spikelist or each spikelistes do need its own.
         """
         if len(self) > 0:
-          #  if self.t_start is None:
-            start_times = numpy.array([self.spiketrains[idx].
-                t_start for idx in self.id_list()], numpy.float)
+            start_times, stop_times = self.spiketrains.time_bounds()
             self.t_start = numpy.min(start_times)
             logging.debug("Warning, t_start is infered from the data : %f" %
                 self.t_start)
-            for id in self.spiketrains.keys():
-                self.spiketrains[id].t_start = self.t_start
-          #  if self.t_stop is None:
-            stop_times = numpy.array([self.spiketrains[idx].
-                t_stop for idx in self.id_list()], numpy.float)
             self.t_stop = numpy.max(stop_times)
             logging.debug(
                 "Warning, t_stop  is infered from the data : %f" % self.t_stop)
-            for id in self.spiketrains.keys():
-                self.spiketrains[id].t_stop = self.t_stop
         else:
             raise Exception("No SpikeTrains")
 
     def __getitem__(self, id):
-        if id in self.id_list():
+        if id in self.spiketrains:
             return self.spiketrains[id]
         else:
             raise Exception(
@@ -943,16 +1732,13 @@ class SpikeList(object):
 
     def __setitem__(self, id, spktrain):
         assert isinstance(spktrain, SpikeTrain), "A SpikeList object can only contain SpikeTrain objects"
-        self.spiketrains[id] = spktrain
         #self.__calc_startstop()
         if (self.t_start is None) or (spktrain.t_start < self.t_start):
-            for i in self.spiketrains:
-                self.spiketrains[i].t_start = spktrain.t_start
             self.t_start = spktrain.t_start
         if (self.t_stop is None) or (spktrain.t_stop > self.t_stop):
-            for i in self.spiketrains:
-                self.spiketrains[i].t_stop = spktrain.t_stop
             self.t_stop = spktrain.t_stop
+        # The SpikeTrain now refers to the time window of the SpikeList
+        self.spiketrains[id] = spktrain
 
     def __iter__(self):
         return self.spiketrains.itervalues()
@@ -970,10 +1756,10 @@ class SpikeList(object):
         Examples:
             >> self.__sub_id_list(50)
         """
-        if sub_list == None:
+        if sub_list is None:
             return self.id_list()
         elif not hasattr(sub_list, '__iter__'):
-            sub_list = [sub_list]
+            return [sub_list]
         #elif type(sub_list) == int:
         #    return numpy.random.permutation(self.id_list())[0:sub_list]
         else:
@@ -999,7 +1785,7 @@ class SpikeList(object):
             concatenate, __setitem__
         """
         assert isinstance(spktrain, SpikeTrain), "A SpikeList object can only contain SpikeTrain objects"
-        if id in self.id_list():
+        if id in self.spiketrains:
             raise Exception("id %d already present in SpikeList. Use __setitem__ (spk[id]=...) instead()" % id)
         else:
             self.spiketrains[id] = spktrain #spktrain.time_slice(self.
@@ -1024,6 +1810,29 @@ class SpikeList(object):
         axis = numpy.arange(self.t_start, self.t_stop + time_bin, time_bin)
         return axis
 
+    def window_axis(self, window, step, t_start=None, t_stop=None):
+        """
+        Return the start times of the sliding windows of length window, moved
+        by step, which fit between t_start and t_stop
+
+        Inputs:
+            window  - the length of the windows, in ms
+            step    - the time between the starts of two windows, in ms
+            t_start - in ms. If not defined, the one of the SpikeList object is used
+            t_stop  - in ms. If not defined, the one of the SpikeList object is used
+
+        See also
+            windowed_rates, windowed_cv_isi, windowed_fano_factors
+        """
+        if t_start is None:
+            t_start = self.t_start
+        if t_stop is None:
+            t_stop = self.t_stop
+        if window > t_stop - t_start:
+            raise Exception("window is longer than the SpikeList")
+        n_windows = int(numpy.floor((t_stop - t_start - window) / step + 1e-9))
+        return t_start + step * numpy.arange(n_windows + 1)
+
     def concatenate(self, spklists):
         """
         Concatenation of SpikeLists to the current SpikeList.
@@ -1064,15 +1873,24 @@ class SpikeList(object):
         See also:
             concatenate, append, __setitem__
         """
-        for id, spiketrain in spikelist.spiketrains.items():
-            if id in self.id_list():
-                                # Does not take relative argument, Check
-                                # SpikeList.merge?
-                self.spiketrains[id] = merge(self.spiketrains[id], spiketrain)
-            else:
-                if relative:
-                    spiketrain.relative_times()
-                self.append(id, spiketrain)
+        if len(spikelist) == 0:
+            return
+        ids, starts, stops, times = spikelist.spiketrains.columns()
+        t_start, t_stop = spikelist.t_start, spikelist.t_stop
+        if relative and t_start != 0:
+            # Does not apply to the merged SpikeTrains
+            new = numpy.logical_not(numpy.in1d(ids, self.id_list()))
+            times = times - numpy.repeat(
+                numpy.where(new, t_start, 0.), stops - starts)
+            if numpy.all(new):
+                t_stop = t_stop - t_start
+            t_start = 0.0
+        self.spiketrains.merge(ids, starts, stops, times)
+        self.complete(spikelist.id_list())
+        if (self.t_start is None) or (t_start < self.t_start):
+            self.t_start = t_start
+        if (self.t_stop is None) or (t_stop > self.t_stop):
+            self.t_stop = t_stop
 
     def complete(self, id_list):
         """
@@ -1089,13 +1907,7 @@ class SpikeList(object):
             >> spklist.id_list()
                 [0,1,2,3,4]
         """
-        id_list = set(id_list)
-        missing_ids = id_list.difference(set(self.id_list()))
-
-        if len(missing_ids) > 0:
-            empty_ST = emptySpikeTrain()
-            missing_sts = zip(missing_ids, [empty_ST] * len(missing_ids))
-            self.spiketrains.update(missing_sts)
+        self.spiketrains.complete(id_list)
 
     def id_slice(self, id_list):
         """
@@ -1105,7 +1917,9 @@ class SpikeList(object):
             id_list - Can be an integer (and then N random cells will be selected)
                       or a sublist of the current ids
 
-        The new SpikeList inherits the time parameters (t_start, t_stop)
+        The new SpikeList inherits the time parameters (t_start, t_stop). It
+        shares the spike times of this one, use copy() to obtain an
+        independent SpikeList.
 
         Examples:
             >> spklist.id_list()
@@ -1115,16 +1929,14 @@ class SpikeList(object):
                 [1011, 729, 1138, 416, 59]
 
         See also
-            time_slice, interval_slice
+            time_slice, interval_slice, copy
         """
         new_SpkList = SpikeList(
             [], [], self.t_start, self.t_stop, self.dimensions)
         id_list = self.__sub_id_list(id_list)
-        for id in id_list:
-            try:
-                new_SpkList.append(id, self.spiketrains[id])
-            except Exception:
-                logging.debug("id %d is not in the source SpikeList or already in the new one" % id)
+        spiketrains = self.spiketrains.id_slice(id_list)
+        spiketrains.window = new_SpkList.spiketrains.window
+        new_SpkList.spiketrains = spiketrains
         return new_SpkList
 
     def time_slice(self, t_start, t_stop):
@@ -1135,14 +1947,19 @@ class SpikeList(object):
             t_start - begining of the new SpikeTrain, in ms.
             t_stop  - end of the new SpikeTrain, in ms.
 
+        The bounds of all the SpikeTrains are found with one binary search
+        over the whole SpikeList. The new SpikeList is a view: it shares the
+        spike times of this one, use copy() to obtain an independent SpikeList.
+
         See also
-            id_slice, interval_slice
+            id_slice, interval_slice, copy
         """
         new_SpkList = SpikeList([], [], t_start, t_stop, self.dimensions)
-        for id in self.id_list():
-            new_SpkList.append(
-                id, self.spiketrains[id].time_slice(t_start, t_stop))
-        new_SpkList.__calc_startstop()
+        spiketrains = self.spiketrains.time_slice(t_start, t_stop)
+        spiketrains.window = new_SpkList.spiketrains.window
+        new_SpkList.spiketrains = spiketrains
+        if len(new_SpkList) > 0:
+            new_SpkList.__calc_startstop()
         return new_SpkList
 
     def time_offset(self, offset=None, t_start=None, t_stop=None):
@@ -1175,8 +1992,7 @@ class SpikeList(object):
         else:
             self.t_stop = t_stop
 
-        for i in self.id_list():
-            self.spiketrains[i].time_offset(offset, self.t_start, self.t_stop)
+        self.spiketrains.time_offset(offset)
 
     def id_offset(self, offset):
         """
@@ -1193,45 +2009,28 @@ class SpikeList(object):
             >> spklist.id_list()
                 [10,11,12,13,14]
         """
-        id_list = numpy.sort(self.id_list())
-        newspiketrains = {}
-        for id in id_list:
-            spk = self.spiketrains.pop(id)
-            newspiketrains[id+offset] = spk
-        self.spiketrains = newspiketrains
+        self.spiketrains.id_offset(offset)
 
 
     def first_spike_time(self):
         """
         Get the time of the first real spike in the SpikeList
         """
-        first_spike = self.t_stop
-        is_empty = True
-        for id in self.id_list():
-            if len(self.spiketrains[id]) > 0:
-                is_empty = False
-                if self.spiketrains[id].spike_times[0] < first_spike:
-                    first_spike = self.spiketrains[id].spike_times[0]
-        if is_empty:
+        ids, starts, stops, times = self.spiketrains.columns()
+        has_spikes = stops > starts
+        if not numpy.any(has_spikes):
             raise Exception("No spikes can be found in the SpikeList object !")
-        else:
-            return first_spike
+        return min(self.t_stop, times[starts[has_spikes]].min())
 
     def last_spike_time(self):
         """
         Get the time of the last real spike in the SpikeList
         """
-        last_spike = self.t_start
-        is_empty = True
-        for id in self.id_list():
-            if len(self.spiketrains[id]) > 0:
-                is_empty = False
-                if self.spiketrains[id].spike_times[-1] > last_spike:
-                    last_spike = self.spiketrains[id].spike_times[-1]
-        if is_empty:
+        ids, starts, stops, times = self.spiketrains.columns()
+        has_spikes = stops > starts
+        if not numpy.any(has_spikes):
             raise Exception("No spikes can be found in the SpikeList object !")
-        else:
-            return last_spike
+        return max(self.t_start, times[stops[has_spikes] - 1].max())
 
     def select_ids(self, criteria):
         """
@@ -1290,6 +2089,73 @@ class SpikeList(object):
         sorted_raw = raw_data[arg_sort_idx, :]
         numpy.savetxt(user_file, sorted_raw)
 
+    def save_binary(self, path, append=False):
+        '''
+        Save the SpikeList in a binary format that can be loaded lazily with
+        load_binary. path is a directory containing the spike times grouped
+        by id (times.npy), the ids and the boundaries of their runs in times
+        (ids.npy, indptr.npy), the ids without spikes (empty_ids.npy), and
+        t_start, t_stop and the dimensions (header.json).
+
+        If append is True and path already holds a SpikeList, the spikes of
+        this SpikeList are added to it, e.g. to gather the recordings of
+        successive runs (see merge and time_offset). Only the new spikes are
+        written, in a separate chunk of files (times_<k>.npy, ...) listed in
+        header.json: appending does not depend on the size of the recording.
+        load_binary memory-maps every chunk, and the SpikeTrain of a neuron
+        is assembled from its spikes in the chunks when it is accessed.
+        '''
+        header_file = os.path.join(path, 'header.json')
+        ids, starts, stops, times = self.spiketrains.columns()
+        has_spikes = stops > starts
+        ids = ids[has_spikes]
+        arrays = {
+            'ids': ids,
+            'indptr': numpy.concatenate(([0], stops[has_spikes])),
+            'times': times,
+            }
+        empty_ids = numpy.setdiff1d(self.id_list(), ids)
+        t_start, t_stop = self.t_start, self.t_stop
+        dims = self.dimensions
+        header = {
+            'n_spikes': len(times),
+            't_start': None if t_start is None else float(t_start),
+            't_stop': None if t_stop is None else float(t_stop),
+            'dims': None if dims is None else numpy.array(dims).tolist(),
+            'chunks': 1,
+            }
+        if append and os.path.exists(header_file):
+            with open(header_file) as fh:
+                previous = json.load(fh)
+            chunk = previous.get('chunks', 1)
+            header['chunks'] = chunk + 1
+            header['n_spikes'] += previous['n_spikes']
+            for key, select in (('t_start', min), ('t_stop', max)):
+                if previous[key] is not None:
+                    header[key] = previous[key] if header[key] is None \
+                        else select(header[key], previous[key])
+            if previous['dims'] is not None:
+                header['dims'] = previous['dims']
+            empty_ids = numpy.union1d(
+                numpy.load(os.path.join(path, 'empty_ids.npy')), empty_ids)
+        else:
+            chunk = 0
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        arrays['empty_ids'] = empty_ids
+
+        # The files are written aside and then renamed, as the current ones
+        # may be memory-mapped
+        for name, array in arrays.iteritems():
+            numpy.save(os.path.join(path, name + '.tmp.npy'), array)
+        with open(os.path.join(path, 'header.tmp.json'), 'w') as fh:
+            json.dump(header, fh)
+        for name in arrays.keys():
+            k = 0 if name == 'empty_ids' else chunk
+            os.rename(os.path.join(path, name + '.tmp.npy'),
+                      os.path.join(path, _chunk_name(name, k)))
+        os.rename(os.path.join(path, 'header.tmp.json'), header_file)
+
     #######################################################################
     ## Analysis methods that can be applied to a SpikeTrain object       ##
     #######################################################################
@@ -1509,6 +2375,54 @@ class SpikeList(object):
             subplot.plot(axis, numpy.mean(spike_hist, axis=0), **kwargs)
             pylab.draw()
 
+    def sparse_spike_histogram(self, time_bin, t_start=None, t_stop=None, dtype=numpy.float64, tau=None):
+        """
+        Return the spike counts of the SpikeTrains (rows, in the order of
+        id_list) in the bins of time_bin, as a scipy.sparse CSR matrix of shape
+        (neurons, bins). The matrix is built directly from the spike times, and
+        its bins are those of spike_histogram: the last one includes t_stop.
+
+        Inputs:
+            time_bin - the time bin used to count the spikes, in ms
+            t_start  - begining of the counts, in ms
+            t_stop   - end of the counts, in ms
+            dtype    - the data type of the matrix
+            tau      - if given, the counts are smoothed by an exponential kernel
+                       exp(-t/tau) (tau in ms), truncated after 5 tau so that the
+                       matrix stays sparse. The smoothed matrix is of type
+                       float64 if dtype is an integer type
+
+        If t_start or t_stop are not defined, those of the SpikeList are used
+
+        See also
+            spike_histogram, time_axis
+        """
+        from scipy import sparse
+        if t_start is None:
+            t_start = self.t_start
+        if t_stop is None:
+            t_stop = self.t_stop
+        edges = numpy.arange(t_start, t_stop + time_bin, time_bin)
+        n_bins = len(edges) - 1
+        ids, starts, stops, times = self.spiketrains.columns()
+        rows = self.id_list().searchsorted(ids)
+        rows = numpy.repeat(rows, stops - starts)
+        keep = (times >= edges[0]) & (times <= edges[-1])
+        bins = numpy.minimum(edges.searchsorted(times[keep], 'right') - 1,
+                             n_bins - 1)
+        counts = sparse.csr_matrix(
+            (numpy.ones(len(bins), dtype), (rows[keep], bins)),
+            shape=(len(self), n_bins), dtype=dtype)
+        if tau is not None:
+            if not numpy.issubdtype(dtype, numpy.inexact):
+                dtype = numpy.float64
+            # Banded matrix spreading the counts of every bin on the next ones
+            lags = numpy.arange(min(int(numpy.ceil(5 * tau / time_bin)), n_bins))
+            kernel = sparse.diags(numpy.exp(-lags * time_bin / float(tau)),
+                                  lags, shape=(n_bins, n_bins), format='csr')
+            counts = (counts * kernel).astype(dtype)
+        return counts
+
     def firing_rate(self, time_bin, display=False, average=False, kwargs={}):
         """
         Generate an array with all the instantaneous firing rates along time (in Hz)
@@ -1568,6 +2482,125 @@ class SpikeList(object):
 
         return fano_factors
 
+    def _window_indices(self, window, step, t_start=None, t_stop=None):
+        """
+        Return the times array of columns() and, for every window of
+        window_axis and SpikeTrain (in the order of id_list), the index in it
+        of the first spike in the window and the index after its last one.
+        """
+        starts = self.window_axis(window, step, t_start, t_stop)
+        ids, run_starts, run_stops, times = self.spiketrains.columns()
+        n = len(starts)
+        runs = numpy.repeat(numpy.arange(len(ids)), run_stops - run_starts)
+        # Cumulative counts of the spikes of every run before the starts, and
+        # up to the ends of the windows
+        first = numpy.bincount(runs * (n + 1) + starts.searchsorted(times, 'right'),
+                               minlength=len(ids) * (n + 1))
+        first = first.reshape(len(ids), n + 1).cumsum(axis=1)[:, :n]
+        after = numpy.bincount(runs * (n + 1) + (starts + window).searchsorted(times, 'left'),
+                               minlength=len(ids) * (n + 1))
+        after = after.reshape(len(ids), n + 1).cumsum(axis=1)[:, :n]
+        # Implicitly empty SpikeTrains have no spike in any window
+        rows = self.id_list().searchsorted(ids)
+        first_all = numpy.zeros((len(self), n), int)
+        after_all = numpy.zeros((len(self), n), int)
+        first_all[rows] = first + run_starts[:, None]
+        after_all[rows] = after + run_starts[:, None]
+        return times, first_all.T, after_all.T
+
+    def windowed_rates(self, window, step, t_start=None, t_stop=None, average=False):
+        """
+        Return the mean firing rates (in Hz) in sliding windows, as an array of
+        shape (windows, neurons), or the population average of shape (windows,)
+        if average is True. The windows are those of window_axis, and include
+        both of their bounds as mean_rates.
+
+        All the windows are computed at once from cumulative spike counts, so
+        that this is much faster than time_slice and mean_rates per window.
+
+        Inputs:
+            window  - the length of the windows, in ms
+            step    - the time between the starts of two windows, in ms
+            t_start - in ms. If not defined, the one of the SpikeList object is used
+            t_stop  - in ms. If not defined, the one of the SpikeList object is used
+
+        See also
+            window_axis, mean_rates, windowed_cv_isi, windowed_fano_factors
+        """
+        times, first, after = self._window_indices(window, step, t_start, t_stop)
+        rates = 1000. * (after - first) / window
+        if average:
+            return rates.mean(axis=1)
+        return rates
+
+    def windowed_cv_isi(self, window, step, t_start=None, t_stop=None, average=False):
+        """
+        Return the CV of the interspike intervals falling in sliding windows,
+        as an array of shape (windows, neurons), NaN where there are less than
+        two spikes. If average is True, the mean over the neurons with a CV is
+        returned for every window.
+
+        See also
+            windowed_rates, cv_isi, window_axis
+        """
+        times, first, after = self._window_indices(window, step, t_start, t_stop)
+        valid = after - first > 1
+        last = after[valid] - 1
+        first = first[valid]
+        n_isi = last - first
+        # The sum of the intervals is the time between the first and the last
+        # spikes, the sum of their squares is taken from a cumulative sum
+        squares = numpy.concatenate(([0.], numpy.cumsum(numpy.diff(times) ** 2)))
+        mean = (times[last] - times[first]) / n_isi
+        var = (squares[last] - squares[first]) / n_isi - mean ** 2
+        cvs = numpy.empty(valid.shape)
+        cvs.fill(numpy.nan)
+        cvs[valid] = numpy.sqrt(numpy.maximum(var, 0)) / mean
+        if average:
+            cvs = numpy.ma.masked_invalid(cvs).mean(axis=1).filled(numpy.nan)
+        return cvs
+
+    def windowed_fano_factors(self, window, step, time_bin, t_start=None, t_stop=None, average=False):
+        """
+        Return the Fano factors of the spike counts in bins of time_bin within
+        sliding windows, as an array of shape (windows, neurons), NaN where
+        there is no spike. If average is True, the Fano factor of the
+        population activity is returned instead, as fano_factor does for the
+        whole SpikeList.
+
+        window and step must be multiples of time_bin.
+
+        See also
+            windowed_rates, fano_factor, window_axis
+        """
+        if t_start is None:
+            t_start = self.t_start
+        starts = self.window_axis(window, step, t_start, t_stop)
+        width = int(round(window / float(time_bin)))
+        shift = int(round(step / float(time_bin)))
+        if not (numpy.allclose(width * time_bin, window) and
+                numpy.allclose(shift * time_bin, step)):
+            raise Exception("window and step must be multiples of time_bin")
+        counts = self.sparse_spike_histogram(time_bin, t_start, t_stop).toarray().T
+        if average:
+            counts = counts.mean(axis=1)[:, None]
+        # Sums of the counts and of their squares over the windows
+        sums = numpy.concatenate((numpy.zeros((1, counts.shape[1])),
+                                  numpy.cumsum(counts, axis=0)))
+        squares = numpy.concatenate((numpy.zeros((1, counts.shape[1])),
+                                     numpy.cumsum(counts ** 2, axis=0)))
+        lo = shift * numpy.arange(len(starts))
+        hi = numpy.minimum(lo + width, counts.shape[0])
+        n = (hi - lo)[:, None]
+        mean = (sums[hi] - sums[lo]) / n
+        var = numpy.maximum((squares[hi] - squares[lo]) / n - mean ** 2, 0)
+        fanos = numpy.empty(mean.shape)
+        fanos.fill(numpy.nan)
+        fanos[mean > 0] = var[mean > 0] / mean[mean > 0]
+        if average:
+            return fanos[:, 0]
+        return fanos
+
     def id2position(self, id, offset=0):
         """
         Return a position (x,y) from an id if the cells are aranged on a
@@ -1656,6 +2689,139 @@ class SpikeList(object):
             frate_1 * frate_2) / N - numpy.sum(frate_1) * numpy.sum(frate_2) / (N * N)
         return cov
 
+    def distance_matrix(self, metric='vanrossum', ids=None, spikelist=None,
+                        processes=1, **kwargs):
+        """
+        Return the matrix of the pairwise distances between the SpikeTrains
+
+        Inputs:
+            metric    - 'vanrossum' or 'victorpurpura', see
+                        SpikeTrain.distance_vanrossum and
+                        SpikeTrain.distance_victorpurpura. The other keyword
+                        arguments (tc, cost, ...) are passed to it
+            ids       - the list of ids to use. If None, all the ids
+            spikelist - if given, the distances are computed between the
+                        SpikeTrains of this SpikeList (rows) and the ones of
+                        spikelist (columns), e.g. to compare two trials
+            processes - number of worker processes. If 1 (default), no
+                        process is started. If None, the number of CPUs
+
+        Within a SpikeList, only the upper triangle is computed. The rows are
+        spread over the processes in interleaved chunks so that they get
+        similar amounts of work.
+
+        Examples:
+            >> d = spklist.distance_matrix('victorpurpura', cost=0.05)
+            >> d = trial1.distance_matrix(spikelist=trial2, tc=10.)
+
+        See also
+            SpikeTrain.distance_vanrossum, SpikeTrain.distance_victorpurpura
+        """
+        if not hasattr(SpikeTrain, 'distance_' + metric):
+            raise ValueError("Unknown metric %s" % metric)
+        rows = [self.spiketrains[id] for id in self.__sub_id_list(ids)]
+        symmetric = spikelist is None
+        if symmetric:
+            columns = rows
+        else:
+            columns = [spikelist.spiketrains[id]
+                       for id in spikelist.__sub_id_list(ids)]
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        n_tasks = max(1, min(len(rows), 4 * processes))
+        tasks = [(range(k, len(rows), n_tasks), symmetric)
+                 for k in range(n_tasks)]
+        results = _map_tasks(_distance_rows, (metric, kwargs, rows, columns),
+                             tasks, processes)
+
+        distances = numpy.zeros((len(rows), len(columns)))
+        for row_indices, values in results:
+            for i, row in zip(row_indices, values):
+                distances[i, len(columns) - len(row):] = row
+        if symmetric:
+            distances += distances.T
+        return distances
+
+    def cross_correlograms(self, time_bin, max_lag, pairs=None,
+                           processes=1):
+        """
+        Return the cross-correlograms of pairs of SpikeTrains, i.e. the
+        histograms of the lags t2 - t1 between the spikes t1 of the first
+        SpikeTrain and t2 of the second one, up to max_lag.
+
+        Inputs:
+            time_bin  - width of the bins, centered on the multiples of
+                        time_bin
+            max_lag   - largest lag, in ms
+            pairs     - list of (id1, id2) pairs. If None, all the pairs of
+                        different ids (id1 < id2)
+            processes - number of worker processes. If 1 (default), no
+                        process is started. If None, the number of CPUs
+
+        Returns the array of the lags and a (number of pairs, number of lags)
+        array of counts.
+
+        Examples:
+            >> lags, ccg = spklist.cross_correlograms(1., 50., [(0, 1), (0, 2)])
+            >> pylab.bar(lags, ccg[0], width=1.)
+
+        See also
+            correlation_matrix, mean_rate_covariance
+        """
+        ids = self.id_list()
+        if pairs is None:
+            i, j = numpy.triu_indices(len(ids), 1)
+        else:
+            pairs = numpy.array(pairs).reshape(-1, 2)
+            if not numpy.all(numpy.in1d(pairs, ids)):
+                raise Exception(
+                    "pairs contain ids not present in the SpikeList. See id_list()")
+            i = ids.searchsorted(pairs[:, 0])
+            j = ids.searchsorted(pairs[:, 1])
+        spike_times = [self.spiketrains[id].spike_times for id in ids]
+        n_side = int(numpy.ceil(float(max_lag) / time_bin))
+        lags = numpy.arange(-n_side, n_side + 1) * time_bin
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        pairs = zip(i.tolist(), j.tolist())
+        n_tasks = max(1, min(len(pairs), 4 * processes))
+        tasks = [(pairs[k::n_tasks],) for k in range(n_tasks)]
+        results = _map_tasks(_correlogram_rows,
+                             (spike_times, time_bin, max_lag), tasks, processes)
+        ccg = numpy.zeros((len(pairs), len(lags)), int)
+        for k, rows in enumerate(results):
+            if len(rows) > 0:
+                ccg[k::n_tasks] = rows
+        return lags, ccg
+
+    def correlation_matrix(self, time_bin, t_start=None, t_stop=None):
+        """
+        Return the matrix of the correlation coefficients of the spike counts
+        of the SpikeTrains in bins of time_bin, as numpy.corrcoef of
+        spike_histogram(time_bin). The covariances are computed from the
+        sparse (neurons x bins) matrix of the counts, the dense histogram is
+        never built.
+
+        Inputs:
+            time_bin - the time bin used to count the spikes, in ms
+            t_start  - begining of the counts, in ms
+            t_stop   - end of the counts, in ms
+
+        If t_start or t_stop are not defined, those of the SpikeList are used
+
+        See also
+            spike_histogram, cross_correlograms, mean_rate_covariance
+        """
+        counts = self.sparse_spike_histogram(time_bin, t_start, t_stop)
+        n_bins = counts.shape[1]
+        mean = numpy.asarray(counts.sum(axis=1)).ravel() / n_bins
+        cov = numpy.asarray((counts * counts.T).todense()) / n_bins - \
+              numpy.outer(mean, mean)
+        std = numpy.sqrt(numpy.diag(cov))
+        return cov / numpy.outer(std, std)
+
     def flatten(self, id=0.0):
         """
         Create a SpikeList with only one address *id* which is the sum of all SpikeTrains in the SpikeList
@@ -1678,7 +2844,8 @@ class SpikeList(object):
         flat_st = self.flatten(id)
         return flat_st.raster_plot(**kwargs)
 
-    def raster_plot(self, id_list=None, t_start=None, t_stop=None, display=True, kwargs={}):
+    def raster_plot(self, id_list=None, t_start=None, t_stop=None, display=True, kwargs={},
+                    density=None, density_threshold=100000, decimate=None):
         """
         Generate a raster plot for the SpikeList in a subwindow of interest,
         defined by id_list, t_start and t_stop.
@@ -1691,6 +2858,11 @@ class SpikeList(object):
             display - if True, a new figure is created. Could also be a subplot
             kwargs  - dictionary contening extra parameters that will be sent to the plot
                       function
+            density - if True, the raster is drawn as an image of the number of spikes
+                      per pixel instead of one marker per spike. The image is computed
+                      again when zooming. If None, it is used when there are more than
+                      density_threshold spikes to plot
+            decimate - if given, only one neuron out of decimate is plotted
 
         Examples:
             >> z = subplot(221)
@@ -1700,10 +2872,13 @@ class SpikeList(object):
             SpikeTrain.raster_plot
         """
         subplot = get_display(display)
-        if id_list == None:
+        if id_list is None and decimate is None:
             id_list = self.id_list()
             spk = self
         else:
+            id_list = self.__sub_id_list(id_list)
+            if decimate is not None:
+                id_list = numpy.asarray(id_list)[::decimate]
             spk = self.id_slice(id_list)
         
 
@@ -1722,20 +2897,28 @@ class SpikeList(object):
         if not subplot or not HAVE_PYLAB:
             warnings.warn('PYLAB_ERROR')
         else:
-            ids, spike_times = spk.convert(format="[ids, times]")
-
-            idx = numpy.where(
-                (spike_times >= t_start) & (spike_times <= t_stop))[0]
-            if len(spike_times) > 0:
-                if kwargs.has_key('linestyle') or kwargs.has_key('ls'):
-                    pass
-                else:
-                    kwargs['ls'] = ''
-                if 'marker' in kwargs:
-                    pass
-                else:
-                    kwargs['marker'] = '.'
-                subplot.plot(spike_times, ids, **kwargs)
+            if density is None:
+                ids, starts, stops, times = spk.spiketrains.runs()
+                density = numpy.sum(stops - starts) > density_threshold
+            if density:
+                ids, spike_times = spk.__flat_ids_times()
+                if hasattr(subplot, 'gca'):
+                    subplot = subplot.gca()
+                _DensityRaster(subplot, ids, spike_times,
+                               kwargs.get('color', kwargs.get('c', 'black')),
+                               kwargs.get('cmap'))
+            else:
+                ids, spike_times = spk.convert(format="[ids, times]")
+                if len(spike_times) > 0:
+                    if kwargs.has_key('linestyle') or kwargs.has_key('ls'):
+                        pass
+                    else:
+                        kwargs['ls'] = ''
+                    if 'marker' in kwargs:
+                        pass
+                    else:
+                        kwargs['marker'] = '.'
+                    subplot.plot(spike_times, ids, **kwargs)
             xlabel = "Time (ms)"
             ylabel = "Neuron"
             set_labels(subplot, xlabel, ylabel)
@@ -1777,8 +2960,16 @@ class SpikeList(object):
         is_times = re.compile("times")
         is_ids = re.compile("ids")
         if len(self) > 0:
-            times = numpy.concatenate([st.format(relative, quantized) for st in self.spiketrains.itervalues()])
-            ids = numpy.concatenate([id * numpy.ones(len(st.spike_times), int) for id, st in self.spiketrains.iteritems()])
+            ids, times = self.__flat_ids_times()
+            times = times.copy()
+            if relative and len(times) > 0:
+                run_starts = numpy.where(numpy.diff(ids) != 0)[0] + 1
+                prev = numpy.concatenate(([0.], times[:-1]))
+                prev[run_starts] = 0.
+                times = times - prev
+            if quantized:
+                assert quantized > 0, "quantized must either be False or a positive number"
+                times = (times / quantized).round().astype('int')
         else:
             times = []
             ids = []
@@ -1816,13 +3007,19 @@ class SpikeList(object):
             convert()
         """
         if len(self) > 0:
-            times = numpy.concatenate([st.spike_times for st in self.spiketrains.itervalues()])
-            ids = numpy.concatenate([id * numpy.ones(len(st.spike_times), int) for id, st in self.spiketrains.iteritems()])
+            ids, times = self.__flat_ids_times()
         else:
             times = []
             ids = []
         return numpy.column_stack([times,ids])
 
+    def __flat_ids_times(self):
+        """
+        Return the arrays of ids and times of all the spikes, grouped by id
+        """
+        ids, starts, stops, times = self.spiketrains.columns()
+        return numpy.repeat(ids, stops - starts), times
+
     def composite_plot(self, id_list=None, t_start=None, t_stop=None, t_start_rate=None, t_stop_rate=None, display=True, kwargs={}, kwargs_bar={}):
         """
         Make a nice Composite plot, *i.e.* a raster plot combined with a vertical rate plot.
@@ -1873,6 +3070,255 @@ class SpikeList(object):
         return axS, axR
 
 
+class SpikeTrials(object):
+    """
+    SpikeTrials(id_list=[])
+
+    Container for the spikes recorded in several trials of the same
+    experiment, for example repeated runs of NeuroSetup with the same
+    stimulus. The spike times of every trial are aligned on its onset.
+
+    The spikes of all the trials are kept in one columnar store, so that
+    trials[k] is a SpikeList view on it and the statistics across trials are
+    computed for all the trials at once.
+
+    Examples:
+        >> trials = SpikeTrials()
+        >> for onset in onsets:
+        >>     trials.append(run(stimulus), onset)
+        >> trials.psth(10., average=True)
+    """
+    def __init__(self, id_list=[]):
+        self._id_list = numpy.unique(id_list)
+        self.onsets = []
+        self.t_start = None
+        self.t_stop = None
+        self._chunks = []
+        self._ids = numpy.zeros(0)
+        self._starts = numpy.zeros(0, int)
+        self._stops = numpy.zeros(0, int)
+        self._times = numpy.zeros(0)
+        self._run_offsets = numpy.zeros(1, int)
+
+    def __len__(self):
+        return len(self.onsets)
+
+    def __iter__(self):
+        for k in xrange(len(self)):
+            yield self[k]
+
+    def __getitem__(self, trial):
+        """
+        Return the SpikeList of the trial, aligned on its onset. It is a view
+        on the spikes of the container.
+        """
+        if trial < 0:
+            trial += len(self)
+        if not 0 <= trial < len(self):
+            raise IndexError("trial %d does not exist" % trial)
+        self.__consolidate()
+        runs = slice(self._run_offsets[trial], self._run_offsets[trial + 1])
+        return SpikeList._from_columns(
+            self._ids[runs], self._starts[runs], self._stops[runs],
+            self._times, self.id_list(), self.t_start, self.t_stop)
+
+    def id_list(self):
+        """
+        Return the sorted array of the ids of all the trials
+        """
+        self.__consolidate()
+        return self._id_list
+
+    def append(self, spikelist, onset=0.):
+        """
+        Add the spikes of spikelist as a new trial starting at onset (in ms).
+        The spikes are copied, spikelist can be reused afterwards.
+
+        As the times of a SpikeList cannot be negative, the spikes emitted
+        before the onset are dropped, and the trial starts at the onset if
+        spikelist starts earlier.
+        """
+        ids, starts, stops, times = spikelist.spiketrains.columns()
+        times = times - onset
+        early = times < 0
+        if numpy.any(early):
+            kept = numpy.concatenate(([0], numpy.cumsum(~early)))
+            starts, stops = kept[starts], kept[stops]
+            times = times[~early]
+        if spikelist.t_start is not None:
+            t_start = max(spikelist.t_start - onset, 0.)
+            t_stop = max(spikelist.t_stop - onset, t_start)
+            if self.t_start is None:
+                self.t_start, self.t_stop = t_start, t_stop
+            else:
+                self.t_start = min(self.t_start, t_start)
+                self.t_stop = max(self.t_stop, t_stop)
+        self._chunks.append((ids, stops - starts, times,
+                             spikelist.id_list()))
+        self.onsets.append(onset)
+
+    def __consolidate(self):
+        """
+        Concatenate the trials appended since the last call to the store
+        """
+        if len(self._chunks) == 0:
+            return
+        ids, lengths, times, id_lists = zip(*self._chunks)
+        self._chunks = []
+        offset = len(self._times)
+        lengths = numpy.concatenate(lengths).astype(int)
+        stops = offset + numpy.cumsum(lengths)
+        self._ids = numpy.concatenate((self._ids,) + ids)
+        self._starts = numpy.concatenate((self._starts, stops - lengths))
+        self._stops = numpy.concatenate((self._stops, stops))
+        self._times = numpy.concatenate((self._times,) + times)
+        self._run_offsets = numpy.concatenate(
+            (self._run_offsets,
+             self._run_offsets[-1] + numpy.cumsum([len(i) for i in ids])))
+        self._id_list = reduce(numpy.union1d, id_lists, self._id_list)
+
+    def counts(self, time_bin=None, t_start=None, t_stop=None):
+        """
+        Return the spike counts of every trial and neuron (in the order of
+        id_list) in the bins of time_bin between t_start and t_stop, aligned on
+        the onsets, as an array of shape (trials, neurons, bins). If time_bin
+        is None, the spikes are counted over [t_start, t_stop], in an array
+        of shape (trials, neurons).
+
+        If t_start or t_stop are not defined, those of the trials are used
+        """
+        id_list = self.id_list()
+        if t_start is None:
+            t_start = self.t_start
+        if t_stop is None:
+            t_stop = self.t_stop
+        lengths = self._stops - self._starts
+        trials = numpy.repeat(numpy.arange(len(self)), numpy.diff(self._run_offsets))
+        cells = numpy.repeat(trials * len(id_list) +
+                             id_list.searchsorted(self._ids), lengths)
+        times = self._times
+        if time_bin is None:
+            n_bins = 1
+            bins = numpy.zeros(len(times), int)
+        else:
+            # Same bins as SpikeList.spike_histogram
+            edges = numpy.arange(t_start, t_stop + time_bin, time_bin)
+            n_bins = len(edges) - 1
+            bins = numpy.minimum(edges.searchsorted(times, 'right') - 1,
+                                 n_bins - 1)
+        keep = (times >= t_start) & (times <= t_stop)
+        counts = numpy.bincount(cells[keep] * n_bins + bins[keep],
+                                minlength=len(self) * len(id_list) * n_bins)
+        counts = counts.reshape(len(self), len(id_list), n_bins)
+        if time_bin is None:
+            return counts[:, :, 0]
+        return counts
+
+    def psth(self, time_bin, t_start=None, t_stop=None, average=False):
+        """
+        Return the peri-stimulus time histograms, in Hz, of the neurons (in the
+        order of id_list) averaged over the trials, as an array of shape
+        (neurons, bins). If average is True, the PSTH of the population is
+        returned.
+
+        See also
+            counts, mean_rates
+        """
+        psth = self.counts(time_bin, t_start, t_stop).mean(axis=0) * 1000. / time_bin
+        if average:
+            return psth.mean(axis=0)
+        return psth
+
+    def rates(self, t_start=None, t_stop=None):
+        """
+        Return the mean firing rates of the neurons in every trial between
+        t_start and t_stop, as an array of shape (trials, neurons)
+        """
+        if t_start is None:
+            t_start = self.t_start
+        if t_stop is None:
+            t_stop = self.t_stop
+        return self.counts(None, t_start, t_stop) * 1000. / (t_stop - t_start)
+
+    def mean_rates(self, t_start=None, t_stop=None):
+        """
+        Return the mean firing rates of the neurons averaged over the trials
+        """
+        return self.rates(t_start, t_stop).mean(axis=0)
+
+    def fano_factors(self, time_bin=None, t_start=None, t_stop=None):
+        """
+        Return the trial-to-trial variability of the spike counts, i.e. their
+        variance across trials divided by their mean, for every neuron (and
+        bin of time_bin if it is given). NaN where no spike was counted.
+
+        See also
+            counts
+        """
+        counts = self.counts(time_bin, t_start, t_stop)
+        mean = counts.mean(axis=0)
+        var = counts.var(axis=0)
+        fanos = numpy.empty(mean.shape)
+        fanos.fill(numpy.nan)
+        fanos[mean > 0] = var[mean > 0] / mean[mean > 0]
+        return fanos
+
+
+class _DensityRaster(object):
+    """
+    Raster plot drawn as an image of the number of spikes falling in every
+    pixel of the axes. The image is computed again for the visible area when
+    the limits of the axes change, so that zooming shows the single spikes.
+    """
+    def __init__(self, axes, ids, spike_times, color='black', cmap=None):
+        self.axes = axes
+        self.ids = ids
+        self.spike_times = spike_times
+        if cmap is None:
+            # Transparent where there is no spike, so that several rasters can
+            # share the axes
+            rgb = matplotlib.colors.colorConverter.to_rgb(color)
+            cmap = matplotlib.colors.LinearSegmentedColormap.from_list(
+                'raster', [rgb + (0.,), rgb + (1.,)])
+        self.image = axes.imshow(numpy.zeros((1, 1)), cmap=cmap,
+                                 origin='lower', aspect='auto',
+                                 interpolation='nearest')
+        # The axes callbacks only keep a weak reference to update
+        self.image.density_raster = self
+        self._updating = False
+        axes.callbacks.connect('xlim_changed', self.update)
+        axes.callbacks.connect('ylim_changed', self.update)
+
+    def update(self, axes=None):
+        """
+        Bin the spikes in the visible area at the resolution of the screen
+        """
+        if self._updating:
+            return
+        x0, x1 = sorted(self.axes.get_xlim())
+        y0, y1 = sorted(self.axes.get_ylim())
+        if x1 <= x0 or y1 <= y0:
+            return
+        bbox = self.axes.get_window_extent()
+        nx = max(int(bbox.width), 1)
+        ny = max(int(bbox.height), 1)
+        t = self.spike_times
+        i = self.ids
+        keep = (t >= x0) & (t <= x1) & (i >= y0) & (i <= y1)
+        ix = numpy.minimum(((t[keep] - x0) * (nx / (x1 - x0))).astype(int),
+                           nx - 1)
+        iy = numpy.minimum(((i[keep] - y0) * (ny / (y1 - y0))).astype(int),
+                           ny - 1)
+        counts = numpy.bincount(iy * nx + ix, minlength=nx * ny)
+        self._updating = True
+        try:
+            self.image.set_data(counts.reshape(ny, nx))
+            self.image.set_extent((x0, x1, y0, y1))
+            self.image.set_clim(0, max(counts.max(), 1))
+        finally:
+            self._updating = False
+
+
 def set_axis_limits(subplot, xmin, xmax, ymin, ymax):
     """
     Defines the axis limits of a plot.
@@ -1945,6 +3391,7 @@ def merge_sequencers(*l_seq):
     '''
     merge_sequencers(stim1, stim2 ......)
     Merges (soon to be) sequencer objects. These are typically returend by pyNCS.group spiketrain functions and used in setup.run
+    The SpikeLists of each channel are merged in one pass, see merge_spikelists
     '''
     from collections import defaultdict
     new_seq = defaultdict(list)
@@ -1977,10 +3424,9 @@ def merge_spiketrain_list(L):
     Takes list of spiketrains and merges them into a single spiketrain. 
     Returns a spiketrain.
 
-    Should only perform a logarithmic number of merges (in terms of list-length)
+    All the spiketrains are merged at once, see merge_sequencers
     '''
-    x = qmerge(L)
-    while len(x) > 1:
-        x = qmerge(x)
-    return x[0]
+    if len(L) == 1:
+        return L[0]
+    return merge_sequencers(*L)
 
@@ -25,14 +25,68 @@ Functions
 shotnoise_fromspikes - Convolves the provided spike train with shot decaying exponential.
 
 gamma_hazard - Compute the hazard function for a gamma process with parameters a,b.
+
+spawn_seeds - Derive independent seeds for parallel random streams from a master seed.
 """
 from __future__ import absolute_import
 
-from .spikes import SpikeTrain
+from .spikes import SpikeTrain, SpikeList, _map_tasks
 from numpy import array, log
+import hashlib
 import numpy
 
 
+def _seed_words(seed):
+    """
+    Return a seed (an integer or a sequence of integers) as an array of
+    uint32 words
+    """
+    if numpy.ndim(seed) == 0:
+        seed = int(seed)
+        if seed < 0:
+            raise ValueError('seed must be non-negative')
+        words = []
+        while True:
+            words.append(seed & 0xffffffff)
+            seed >>= 32
+            if seed == 0:
+                break
+        return numpy.array(words, 'uint32')
+    return numpy.asarray(seed).astype('uint32')
+
+
+def spawn_seeds(seed, n, key=()):
+    """
+    Return n seeds of independent random streams derived from a master seed,
+    in the manner of numpy's SeedSequence.spawn. The i-th seed is the hash of
+    the master seed and of the spawn key key + (i,), so it only depends on
+    seed, key and i: streams generated in any order, in any process, are
+    reproducible.
+
+    Every seed is an array of 8 uint32 words, to be passed to
+    numpy.random.RandomState or to StGen(seed=...).
+
+    Inputs:
+        seed - the master seed, an integer or a sequence of integers
+        n    - the number of seeds
+        key  - the spawn key of the parent stream, a tuple of integers
+
+    Examples:
+        >> rngs = [numpy.random.RandomState(s) for s in spawn_seeds(42, 4)]
+    """
+    entropy = _seed_words(seed)
+    # The length of the entropy is hashed too so that key words can not be
+    # confused with seed words
+    head = numpy.array([len(entropy)], 'uint32').astype('<u4').tostring()
+    head += entropy.astype('<u4').tostring()
+    seeds = []
+    for i in range(n):
+        words = numpy.array(tuple(key) + (i,), 'uint32').astype('<u4')
+        digest = hashlib.sha256(head + words.tostring()).digest()
+        seeds.append(numpy.frombuffer(digest, '<u4').astype('uint32'))
+    return seeds
+
+
 def gamma_hazard(x, a, b, dt=1e-4):
     """
     Compute the hazard function for a gamma process with parameters a,b
@@ -68,6 +122,51 @@ def gamma_hazard(x, a, b, dt=1e-4):
         return val
 
 
+# Rows of the hazard tables of gamma_hazard_table, computed once for every
+# shape parameter of the lattice
+_gamma_hazard_rows = {}
+
+
+def gamma_hazard_table(a, steps=16, dv=2e-3, v_max=20.):
+    """
+    Tabulate the hazard function of gamma processes with parameters a and
+    b = 1, i.e. gamma_hazard(u, a, 1), on a fixed lattice: the shape
+    parameters 2 ** (k / steps) for the integers k around the values of the
+    array a, and the times u = v * 2 ** (k / steps) in units of the mean
+    interval, for v = 0, dv, 2 * dv, ... v_max. The hazard function for any b
+    is gamma_hazard(x, a, b) = gamma_hazard(x / b, a, 1) / b, and it can be
+    interpolated in a and v between the nodes of the lattice. Beyond v_max,
+    the hazard is close to its limit 1.
+
+    The hazard is computed as the ratio of the PDF and of the survival
+    function in logarithmic scale, which does not have the numerical problems
+    of gamma_hazard for large u. The rows of the lattice are computed once and
+    kept for the following calls.
+
+    Returns the table, of shape (number of shape parameters, len(v)), the k of
+    its first row and dv.
+
+    See also:
+        gamma_hazard, inh_gamma_population
+    """
+    from scipy.stats import gamma
+    k = numpy.log2(numpy.atleast_1d(a)) * steps
+    k_min = int(numpy.floor(k.min()))
+    k_max = int(numpy.floor(k.max())) + 1
+    v = numpy.arange(0, v_max + dv, dv)
+    # the hazard is infinite at 0 for a < 1
+    v[0] = dv / 2
+    rows = []
+    for i in xrange(k_min, k_max + 1):
+        key = (i, steps, dv, v_max)
+        if key not in _gamma_hazard_rows:
+            shape = 2 ** (float(i) / steps)
+            _gamma_hazard_rows[key] = numpy.exp(
+                gamma.logpdf(v * shape, shape) - gamma.logsf(v * shape, shape))
+        rows.append(_gamma_hazard_rows[key])
+    return numpy.array(rows), k_min, dv
+
+
 #def gamma_hazard_rpy(x, a, b, dt=1e-4):
 #    """
 #    Compute the hazard function for a gamma process with parameters a,b
@@ -126,7 +225,8 @@ class StGen:
 
         If rng is not None, the provided rng will be used to generate random numbers,
         otherwise StGen will create its own random number generator.
-        If a seed is provided, it is passed to rng.seed(seed)
+        If a seed is provided, it is passed to rng.seed(seed). It is also the
+        master seed of the independent generators returned by spawn.
 
         Examples:
             >> x = StGen()
@@ -145,10 +245,30 @@ class StGen:
         inh_2Dadaptingmarkov_generator - inhomogeneous adapting and
                                          refractory markov process (time varying)
 
+        The *_population methods generate SpikeLists of many independent
+        neurons at once (regular_population, regular_gaussian_population,
+        poisson_population, inh_poisson_population, inh_gamma_population,
+        inh_adaptingmarkov_population, inh_2Dadaptingmarkov_population).
+
+        mip_population - correlated Poisson processes (Multiple Interaction Process)
+        sip_population - correlated Poisson processes (Single Interaction Process)
+
         Continuous time processes:
         --------------------------
 
         OU_generator - Ohrnstein-Uhlenbeck process
+        OU_population - independent Ohrnstein-Uhlenbeck processes
+        inh_OU_generator - Ohrnstein-Uhlenbeck process (time varying mean)
+
+
+        Parallel generation:
+        --------------------
+
+        spawn - independent generators with reproducible random streams
+        population_blocks - a population generated by blocks of neurons,
+                            possibly in a pool of processes
+        population_stream - a population generated in consecutive chunks
+                            of time, for continuous stimulation
 
 
         See also:
@@ -161,13 +281,152 @@ class StGen:
         else:
             self.rng = rng
 
-        if seed != None:
-            self.rng.seed(seed)
+        self._entropy = None
+        self._n_spawned = 0
+        if seed is not None:
+            self.seed(seed)
         self.rpy_checked = False
 
     def seed(self, seed):
         """ seed the gsl rng with a given seed """
         self.rng.seed(seed)
+        self._entropy = _seed_words(seed)
+        self._n_spawned = 0
+
+    def spawn(self, n):
+        """
+        Return n new StGen objects, with independent random streams derived
+        from the seed of this generator (see spawn_seeds). Successive calls
+        return new streams, and the sequence of streams is reproduced after
+        seed is called with the same seed. The random stream of this generator
+        is not used, unless it was never seeded: a master seed is then drawn
+        from it.
+
+        Examples:
+            >> gen = StGen(seed=42)
+            >> gen_a, gen_b = gen.spawn(2)
+        """
+        if self._entropy is None:
+            self._entropy = self.rng.randint(0, 2 ** 32, 4, dtype='uint32')
+        seeds = spawn_seeds(self._entropy, self._n_spawned + n)
+        self._n_spawned += n
+        return [StGen(seed=s) for s in seeds[-n:]] if n > 0 else []
+
+    def population_blocks(self, method, id_list, args=(), rows=(), block_size=1024, processes=1, **kwargs):
+        """
+        Returns a SpikeList generated by a population method of StGen (e.g.
+        'poisson_population'), by blocks of block_size neurons. Every block
+        is generated with its own StGen from spawn, so the blocks can be
+        generated in a pool of processes: the result only depends on the seed
+        of this generator and on block_size, not on processes.
+
+        Inputs:
+            method     - the name of the population method
+            id_list    - the ids of the neurons
+            args       - the positional arguments of the method before
+                         id_list, e.g. (rates, t_start, t_stop)
+            rows       - the indexes in args of the arguments with one row per
+                         neuron of id_list, which are split with the neurons
+            block_size - the number of neurons of every block
+            processes  - the number of processes generating the blocks. If
+                         None, one per CPU.
+            kwargs     - the other keyword arguments of the method
+
+        Examples:
+            >> gen = StGen(seed=42)
+            >> gen.population_blocks('poisson_population', range(10 ** 5),
+                                     (rates, 0, 1000), rows=(0,), processes=4)
+        """
+        id_list = numpy.asarray(id_list)
+        order = numpy.argsort(id_list, kind='mergesort')
+        bounds = range(0, len(id_list), block_size)
+        generators = self.spawn(len(bounds))
+        tasks = []
+        for gen, start in zip(generators, bounds):
+            block = order[start:start + block_size]
+            block_args = [numpy.asarray(a)[block] if i in rows else a
+                          for i, a in enumerate(args)]
+            tasks.append((gen._entropy, id_list[block], tuple(block_args)))
+        results = _map_tasks(_population_block, (method, kwargs), tasks,
+                             processes)
+        ids = numpy.concatenate([r[0] for r in results] + [id_list[:0]])
+        counts = numpy.concatenate([r[1] for r in results] + [numpy.zeros(0, int)])
+        times = numpy.concatenate([r[2] for r in results] + [numpy.zeros(0)])
+        t_start = min(r[3] for r in results) if results else None
+        t_stop = max(r[4] for r in results) if results else None
+        return _population(ids, counts, times, t_start, t_stop, False)
+
+    # The parameters of the population generators which have a value per
+    # neuron and per time bin
+    _stream_parameters = {'inh_poisson_population': ('rates',),
+                          'inh_gamma_population': ('a', 'b'),
+                          'inh_adaptingmarkov_population': ('a', 'bq'),
+                          'inh_2Dadaptingmarkov_population': ('a', 'bq')}
+
+    def population_stream(self, method, chunk_duration, t_start=0.0, t_stop=None, id_list=None, **params):
+        """
+        Generator of the spikes of a population, in consecutive chunks of
+        chunk_duration ms from t_start to t_stop (forever if t_stop is None).
+        Each chunk is generated by the population method of StGen (e.g.
+        'inh_gamma_population') called on a single time bin. The state of the
+        processes (times of the last spikes, adaptation variables) and the
+        random state are carried from a chunk to the next, so the memory used
+        does not depend on the duration of the stream.
+
+        Yields the arrays (ids, times) of the spikes of every chunk, grouped
+        by id and sorted by time.
+
+        Inputs:
+            method         - 'inh_poisson_population', 'inh_gamma_population',
+                             'inh_adaptingmarkov_population' or
+                             'inh_2Dadaptingmarkov_population'
+            chunk_duration - the duration of the chunks (in ms)
+            t_start        - the beginning of the stream (in ms)
+            t_stop         - the end of the stream (in ms), or None
+            id_list        - the ids of the neurons. Default is
+                             range(number of neurons)
+            params         - the other parameters of the method. Those varying
+                             in time (rates, a, b or bq) are given per neuron,
+                             or as a single value for all of them.
+
+        New parameters can be sent to the generator, as a dict, to change them
+        from the next chunk on.
+
+        Examples:
+            >> stream = gen.population_stream('inh_poisson_population', 1000,
+                                              rates=20 * numpy.ones(100))
+            >> ids, times = stream.next()
+            >> ids, times = stream.send({'rates': 50 * numpy.ones(100)})
+
+        See also:
+            inh_poisson_population, inh_gamma_population,
+            inh_2Dadaptingmarkov_population
+        """
+        if method not in self._stream_parameters:
+            raise ValueError('{0} can not be streamed'.format(method))
+        varying = self._stream_parameters[method]
+        if id_list is None:
+            id_list = numpy.arange(max(numpy.size(params[name]) for name in varying))
+        id_list = numpy.asarray(id_list)
+        kwargs = {}
+        if method != 'inh_poisson_population':
+            kwargs['state'] = {}
+        t0 = t_start
+        while t_stop is None or t0 < t_stop:
+            t1 = t0 + chunk_duration
+            if t_stop is not None:
+                t1 = min(t1, t_stop)
+            for name, value in params.iteritems():
+                if name in varying:
+                    value = numpy.reshape(numpy.asarray(value, 'float'), (-1, 1))
+                    value = value * numpy.ones((len(id_list), 1))
+                kwargs[name] = value
+            update = yield getattr(self, method)(t=numpy.array([t0], 'float'),
+                                                 t_stop=t1, id_list=id_list,
+                                                 array=True, **kwargs)
+            if update:
+                params.update(update)
+            t0 = t1
 
     def regular_gaussian_generator(self, rate, phase=0.0, scale=5., t_start=0.0, t_stop=1000.0, array=False):
         """
@@ -196,11 +455,7 @@ class StGen:
             inh_poisson_generator, inh_gamma_generator, inh_adaptingmarkov_generator
         """
 
-        import scipy.stats
-
         n = (t_stop - t_start) / 1000.0 * rate
-        t_bin = 1
-        time_axis = numpy.arange(t_start, t_stop, t_bin)
 
         if n > 0:
             t_peaks = numpy.arange(
@@ -211,8 +466,7 @@ class StGen:
         #Some spikes will fall off the starting edge. Get rid of them
         t_peaks = t_peaks[t_peaks > 0.]
 
-        spike_times = numpy.array(
-            [scipy.stats.norm.rvs(t, scale) for t in t_peaks])
+        spike_times = t_peaks + scale * self.rng.standard_normal(len(t_peaks))
 
         if not array:
             return SpikeTrain(spike_times, t_start=t_start, t_stop=t_stop)
@@ -231,7 +485,7 @@ class StGen:
             rate    - the rate of the discharge (in Hz)
             t_start - the beginning of the SpikeTrain (in ms)
             phase   - Offset the spiketrain by this number (in ms.)
-            jitter  - whether the spiketrain should be jittered by an amount numpy.random.rand()/rate
+            jitter  - whether the spiketrain should be jittered by an amount rng.rand()/rate
             t_stop  - the end of the SpikeTrain (in ms)
             array   - if True, a numpy array of sorted spikes is returned,
                       rather than a SpikeTrain object.
@@ -256,15 +510,115 @@ class StGen:
             spikes = numpy.array([])
 
         if jitter:
-            spikes += numpy.random.rand() * 1000. / rate
+            spikes += self.rng.rand() * 1000. / rate
             #Remove any spikes that extend beyond t_stop
             spikes = spikes[spikes<t_stop]
 
         if not array:
-            spikes = SpikeTrain(spikes, t_start=t_start, t_stop=t_stop)
+            spikes = SpikeTrain.from_sorted(spikes, t_start=t_start, t_stop=t_stop)
 
         return spikes
 
+    def _regular_peaks(self, rates, phases, t_start, t_stop):
+        """
+        Return the neurons (rows) and the times of the regularly spaced spikes
+        arange(t_start, t_stop, 1000. / rates[i]) + phases[i] of all the
+        neurons i, grouped by neuron
+        """
+        with numpy.errstate(divide='ignore'):
+            periods = 1000. / rates
+        counts = numpy.where(rates > 0,
+                             numpy.ceil((t_stop - t_start) / periods), 0)
+        counts = numpy.maximum(counts, 0).astype(int)
+        rows = numpy.repeat(numpy.arange(len(rates)), counts)
+        k = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return rows, t_start + k * periods[rows] + phases[rows]
+
+    def regular_population(self, rates, phases=0.0, jitter=True, t_start=0.0, t_stop=1000.0, id_list=None, array=False):
+        """
+        Returns a SpikeList whose SpikeTrains are regularly spaced, as
+        regular_generator, for all the neurons at once: the spike times of all
+        the neurons are computed in a single array.
+
+        Inputs:
+            rates   - an array of the rates of the neurons (in Hz), or a single
+                      rate for all of them if id_list is given
+            phases  - the offsets of the spike trains (in ms), an array or a
+                      single value
+            jitter  - whether every spike train should be shifted by
+                      rng.rand()/rate
+            t_start - the beginning of the SpikeTrains (in ms)
+            t_stop  - the end of the SpikeTrains (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        See also:
+            regular_generator, regular_gaussian_population
+        """
+        ids, rates, phases = self._population_arguments(id_list, rates, phases)
+        rows, times = self._regular_peaks(rates, phases, t_start, t_stop)
+        if jitter:
+            with numpy.errstate(divide='ignore'):
+                shifts = self.rng.rand(len(rates)) * 1000. / rates
+            times += shifts[rows]
+            keep = (times >= t_start) & (times < t_stop)
+        else:
+            keep = (times >= t_start) & (times <= t_stop)
+        counts = numpy.bincount(rows[keep], minlength=len(ids))
+        return _population(ids, counts, times[keep], t_start, t_stop, array)
+
+    def regular_gaussian_population(self, rates, phases=0.0, scale=5., t_start=0.0, t_stop=1000.0, id_list=None, array=False):
+        """
+        Returns a SpikeList whose SpikeTrains are regularly spaced and jittered
+        according to a Gaussian distribution, as regular_gaussian_generator,
+        for all the neurons at once: the jitters of all the spikes are drawn
+        at once, and the spikes are sorted in a single sort.
+
+        Inputs:
+            rates   - an array of the rates of the neurons (in Hz), or a single
+                      rate for all of them if id_list is given
+            phases  - the offsets of the spike trains (in ms), an array or a
+                      single value
+            scale   - width of the Gaussian distribution placed at the regular
+                      spike times, according to which the spike will be drawn
+                      (in ms)
+            t_start - the beginning of the SpikeTrains (in ms)
+            t_stop  - the end of the SpikeTrains (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        The spikes jittered out of [t_start, t_stop] are removed.
+
+        See also:
+            regular_gaussian_generator, regular_population
+        """
+        ids, rates, phases = self._population_arguments(id_list, rates, phases)
+        rows, peaks = self._regular_peaks(rates, phases, t_start, t_stop)
+        #Some spikes will fall off the starting edge. Get rid of them
+        rows, peaks = rows[peaks > 0.], peaks[peaks > 0.]
+        times = peaks + scale * self.rng.standard_normal(len(peaks))
+        order = numpy.lexsort((times, rows))
+        rows, times = rows[order], times[order]
+        keep = (times >= t_start) & (times <= t_stop)
+        counts = numpy.bincount(rows[keep], minlength=len(ids))
+        return _population(ids, counts, times[keep], t_start, t_stop, array)
+
+    def _population_arguments(self, id_list, *args):
+        """
+        Return the sorted ids and the arguments of a population generator, one
+        value per neuron, sorted like the ids
+        """
+        if id_list is None:
+            id_list = numpy.arange(max(numpy.size(a) for a in args))
+        id_list = numpy.asarray(id_list)
+        order = numpy.argsort(id_list, kind='mergesort')
+        args = [numpy.asarray(a, 'float') * numpy.ones(len(id_list)) for a in args]
+        return [id_list[order]] + [a[order] for a in args]
+
     def poisson_generator(self, rate, t_start=0.0, t_stop=1000.0, array=False, debug=False, refractory=0):
         """
         Returns a SpikeTrain whose spikes are a realization of a Poisson process
@@ -331,13 +685,219 @@ class StGen:
             spikes = numpy.resize(spikes, (i,))
 
         if not array:
-            spikes = SpikeTrain(spikes, t_start=t_start, t_stop=t_stop)
+            spikes = SpikeTrain.from_sorted(spikes, t_start=t_start, t_stop=t_stop)
 
         if debug:
             return spikes, extra_spikes
         else:
             return spikes
 
+    def poisson_population(self, rates, t_start=0.0, t_stop=1000.0, id_list=None, array=False):
+        """
+        Returns a SpikeList whose SpikeTrains are realizations of independent
+        Poisson processes with the given rates (Hz), between t_start and
+        t_stop (milliseconds).
+
+        All the SpikeTrains are generated at once: the number of spikes of
+        every neuron is drawn from a Poisson distribution, and the spikes are
+        placed uniformly in [t_start, t_stop). The SpikeList is built directly
+        from these columns.
+
+        Inputs:
+            rates   - an array of the rates of the neurons (in Hz), or a single
+                      rate for all of them if id_list is given
+            t_start - the beginning of the SpikeTrains (in ms)
+            t_stop  - the end of the SpikeTrains (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        Examples:
+            >> gen.poisson_population(100 * numpy.ones(2 ** 15), 0, 1000)
+            >> gen.poisson_population(20, 0, 1000, id_list=range(10))
+
+        See also:
+            poisson_generator
+        """
+        if id_list is None:
+            id_list = numpy.arange(len(rates))
+        id_list = numpy.asarray(id_list)
+        rates = numpy.asarray(rates, 'float') * numpy.ones(len(id_list))
+        order = numpy.argsort(id_list, kind='mergesort')
+        counts, times = self._poisson_columns(rates[order], t_start, t_stop)
+        return _population(id_list[order], counts, times, t_start, t_stop, array)
+
+    def _poisson_columns(self, rates, t_start, t_stop):
+        """
+        Return the numbers of spikes and the spike times, grouped by neuron and
+        sorted, of Poisson processes with the given rates (Hz)
+        """
+        counts = self.rng.poisson(rates * (t_stop - t_start) / 1000.0)
+        rows = numpy.repeat(numpy.arange(len(counts)), counts)
+        # Sorting row + u sorts the uniform numbers u within every neuron
+        u = numpy.sort(rows + self.rng.uniform(0, 1, len(rows))) - rows
+        return counts, t_start + u * (t_stop - t_start)
+
+    def mip_population(self, rates, c, jitter=0.0, t_start=0.0, t_stop=1000.0, id_list=None, array=False):
+        """
+        Returns a SpikeList of correlated Poisson processes with the given
+        rates (Hz), generated as a Multiple Interaction Process: every neuron
+        copies the spikes of a common mother Poisson process independently,
+        and has independent background spikes if needed. The spike counts of
+        the neurons i and j have the pairwise correlation coefficient
+        sqrt(c[i] * c[j]) (c for all the pairs if c is a single value), in
+        time bins larger than the jitter.
+
+        With p[i] the probability of neuron i to copy a spike of the mother
+        process of rate nu, the rates are p[i] * nu + background[i], and the
+        correlations p[i] * p[j] * nu / sqrt(rates[i] * rates[j]). nu is the
+        largest rate for which no background rate is negative, i.e.
+        min(rates / c). For equal rates and correlations, there is no
+        background and p = c.
+
+        All the neurons are generated at once: the copied spikes of every
+        neuron are found by skipping geometrically distributed numbers of
+        mother spikes, so that the time taken grows with the number of
+        generated spikes only.
+
+        Inputs:
+            rates   - an array of the rates of the neurons (in Hz), or a single
+                      rate for all of them if id_list is given
+            c       - the correlation coefficients, an array or a single value
+                      in [0, 1]
+            jitter  - the standard deviation of a Gaussian jitter added to
+                      every copied spike (in ms). The spikes jittered out of
+                      [t_start, t_stop] are removed.
+            t_start - the beginning of the SpikeTrains (in ms)
+            t_stop  - the end of the SpikeTrains (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        References:
+
+        Kuhn A, Aertsen A, Rotter S (2003) Higher-order statistics of input
+        ensembles and the response of simple model neurons. Neural Comput
+        15:67-101.
+
+        Examples:
+            >> gen.mip_population(20, 0.1, 0, 1000, id_list=range(100))
+            >> gen.mip_population(20 * numpy.ones(100), numpy.linspace(0, .2, 100),
+                                  jitter=2.)
+
+        See also:
+            sip_population, poisson_population
+        """
+        ids, rates, c = self._population_arguments(id_list, rates, c)
+        if numpy.any((c < 0) | (c > 1)):
+            raise ValueError('the correlations must be in [0, 1]')
+        correlated = (c > 0) & (rates > 0)
+        if numpy.any(correlated):
+            nu = numpy.min(rates[correlated] / c[correlated])
+        else:
+            nu = 0.
+        p = numpy.zeros(len(ids))
+        p[correlated] = numpy.sqrt(c[correlated] * rates[correlated] / nu)
+        if numpy.any(p > 1 + 1e-12):
+            raise ValueError('the correlations can not be reached with these rates: c[i] * rates[i] must be smaller than rates[j] / c[j]')
+        p = numpy.minimum(p, 1.)
+        background = numpy.maximum(rates - p * nu, 0.)
+        return self._correlated_population(ids, nu, p, background, jitter,
+                                           t_start, t_stop, array)
+
+    def sip_population(self, rates, c, jitter=0.0, t_start=0.0, t_stop=1000.0, id_list=None, array=False):
+        """
+        Returns a SpikeList of correlated Poisson processes with the given
+        rates (Hz), generated as a Single Interaction Process: all the neurons
+        share the spikes of a common Poisson process of rate c * min(rates),
+        completed by independent background spikes. The spike counts of
+        neurons of equal rates have the pairwise correlation coefficient c
+        (c * min(rates) / sqrt(rates[i] * rates[j]) in general), in time bins
+        larger than the jitter.
+
+        Inputs:
+            rates   - an array of the rates of the neurons (in Hz), or a single
+                      rate for all of them if id_list is given
+            c       - the correlation coefficient, in [0, 1]
+            jitter  - the standard deviation of a Gaussian jitter added to
+                      every shared spike (in ms). The spikes jittered out of
+                      [t_start, t_stop] are removed.
+            t_start - the beginning of the SpikeTrains (in ms)
+            t_stop  - the end of the SpikeTrains (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        Examples:
+            >> gen.sip_population(20, 0.1, 0, 1000, id_list=range(100))
+
+        See also:
+            mip_population, poisson_population
+        """
+        if not 0 <= c <= 1:
+            raise ValueError('the correlation must be in [0, 1]')
+        ids, rates = self._population_arguments(id_list, rates)
+        nu = c * numpy.min(rates) if len(rates) > 0 else 0.
+        p = numpy.ones(len(ids))
+        return self._correlated_population(ids, nu, p, rates - nu, jitter,
+                                           t_start, t_stop, array)
+
+    def _correlated_population(self, ids, nu, p, background, jitter, t_start, t_stop, array):
+        """
+        Return the population of neurons copying the spikes of a mother
+        Poisson process of rate nu with the probabilities p, jittered, plus
+        independent Poisson spikes of rates background
+        """
+        n_mother, mother = self._poisson_columns(numpy.array([nu]), t_start, t_stop)
+        rows, copied = self._copy_spikes(n_mother[0], p)
+        times = mother[copied]
+        if jitter > 0:
+            times = times + jitter * self.rng.standard_normal(len(times))
+        counts, background_times = self._poisson_columns(background, t_start, t_stop)
+        rows = numpy.concatenate([rows, numpy.repeat(numpy.arange(len(ids)), counts)])
+        times = numpy.concatenate([times, background_times])
+        order = numpy.lexsort((times, rows))
+        rows, times = rows[order], times[order]
+        keep = (times >= t_start) & (times <= t_stop)
+        counts = numpy.bincount(rows[keep], minlength=len(ids))
+        return _population(ids, counts, times[keep], t_start, t_stop, array)
+
+    def _copy_spikes(self, n, p):
+        """
+        Return the neurons (rows) and the indexes of the spikes they copy,
+        grouped by neuron, when neuron i copies every one of n spikes with the
+        probability p[i]. The intervals between the copied indexes are drawn
+        from geometric distributions, in rounds of a few more than expected
+        for every neuron.
+        """
+        rows_out = [numpy.zeros(0, int)]
+        indexes_out = [numpy.zeros(0, int)]
+        last = -numpy.ones(len(p), int)
+        rows = numpy.flatnonzero(p > 0) if n > 0 else numpy.zeros(0, int)
+        while len(rows) > 0:
+            pr = p[rows]
+            expected = (n - 1 - last[rows]) * pr
+            draws = numpy.ceil(expected + 5 * numpy.sqrt(expected) + 10).astype(int)
+            cells = numpy.repeat(numpy.arange(len(rows)), draws)
+            steps = numpy.cumsum(self.rng.geometric(pr[cells]))
+            ends = numpy.cumsum(draws) - 1
+            # cumulative sums restarting at every neuron
+            before = numpy.concatenate([[0], steps[ends[:-1]]])
+            indexes = last[rows][cells] + steps - before[cells]
+            keep = indexes < n
+            rows_out.append(rows[cells[keep]])
+            indexes_out.append(indexes[keep])
+            # neurons which did not reach the last spike need more draws
+            last[rows] = indexes[ends]
+            rows = rows[indexes[ends] < n - 1]
+        rows = numpy.concatenate(rows_out)
+        indexes = numpy.concatenate(indexes_out)
+        order = numpy.lexsort((indexes, rows))
+        return rows[order], indexes[order]
+
     def inh_poisson_generator(self, rate, t, t_stop, base_generator=None, array=False, **base_generator_kwargs):
         """
         Returns a SpikeList whose spikes are a realization of an inhomogeneous
@@ -389,7 +949,7 @@ class StGen:
             if array:
                 return numpy.array([])
             else:
-                return SpikeTrain(numpy.array([]), t_start=t[0], t_stop=t_stop)
+                return SpikeTrain.from_sorted(numpy.array([]), t_start=t[0], t_stop=t_stop)
 
         # gen uniform rand on 0,1 for each spike
         rn = numpy.array(self.rng.uniform(0, 1, len(ps)))
@@ -405,7 +965,71 @@ class StGen:
         if array:
             return spike_train
 
-        return SpikeTrain(spike_train, t_start=t[0], t_stop=t_stop)
+        return SpikeTrain.from_sorted(spike_train, t_start=t[0], t_stop=t_stop)
+
+    def inh_poisson_population(self, rates, t, t_stop, id_list=None, array=False, chunk_size=2 ** 22):
+        """
+        Returns a SpikeList whose SpikeTrains are realizations of independent
+        inhomogeneous Poisson processes, rates[i] being the rates of the
+        neuron id_list[i] as in inh_poisson_generator.
+
+        All the neurons are generated at once: the number of spikes of every
+        neuron in every bin is drawn from a Poisson distribution, and the
+        spikes are placed uniformly in their bins, which is exact for rates
+        which are constant in the bins. The rows of rates are processed in
+        chunks of about chunk_size (neuron, bin) pairs to bound the memory.
+
+        Inputs:
+            rates   - an array of shape (neurons, bins) of the rates (Hz), where
+                      rates[:, j] is active on interval [t[j],t[j+1]]
+            t       - an array specifying the time bins (in milliseconds) at
+                      which to specify the rates
+            t_stop  - length of time to simulate process (in ms)
+            id_list - the ids of the neurons. Default is range(len(rates))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+
+        Note:
+            t_start=t[0]
+
+        The SpikeList is built from the columns of the spikes, so that it can
+        be passed to exportAER without creating a SpikeTrain per neuron.
+
+        See also:
+            inh_poisson_generator, poisson_population
+        """
+        rates = numpy.atleast_2d(numpy.asarray(rates, 'float'))
+        t = numpy.asarray(t, 'float')
+        if rates.shape[1] != len(t):
+            raise ValueError(
+                'shape mismatch: t and the rows of rates must be of the same length')
+        if id_list is None:
+            id_list = numpy.arange(rates.shape[0])
+        id_list = numpy.asarray(id_list)
+        order = numpy.argsort(id_list, kind='mergesort')
+        ids = id_list[order]
+        n_bins = len(t)
+        # The bins are cut at t_stop
+        widths = numpy.maximum(
+            numpy.minimum(numpy.append(t[1:], t_stop), t_stop) - t, 0)
+
+        counts = [numpy.zeros(0, int)]
+        times = [numpy.zeros(0)]
+        rows_per_chunk = max(chunk_size // max(n_bins, 1), 1)
+        for i in xrange(0, len(ids), rows_per_chunk):
+            chunk_counts = self.rng.poisson(
+                rates[order[i:i + rows_per_chunk]] * widths / 1000.0)
+            cells = numpy.repeat(numpy.arange(chunk_counts.size),
+                                 chunk_counts.ravel())
+            # Sorting cell + u sorts the uniform numbers u within every bin
+            u = numpy.sort(cells + self.rng.uniform(0, 1, len(cells))) - cells
+            bins = cells % n_bins
+            times.append(t[bins] + u * widths[bins])
+            counts.append(chunk_counts.sum(axis=1))
+        counts = numpy.concatenate(counts)
+        times = numpy.concatenate(times)
+        return _population(ids, counts, times, t[0], t_stop, array)
 
     def _inh_gamma_generator_python(self, a, b, t, t_stop, array=False):
         """
@@ -458,7 +1082,7 @@ class StGen:
             if array:
                 return numpy.array([])
             else:
-                return SpikeTrain(numpy.array([]), t_start=t[0], t_stop=t_stop)
+                return SpikeTrain.from_sorted(numpy.array([]), t_start=t[0], t_stop=t_stop)
 
         # gen uniform rand on 0,1 for each spike
         rn = numpy.array(self.rng.uniform(0, 1, len(ps)))
@@ -491,10 +1115,9 @@ class StGen:
         if array:
             return spike_train
 
-        return SpikeTrain(spike_train, t_start=t[0], t_stop=t_stop)
+        return SpikeTrain.from_sorted(spike_train, t_start=t[0], t_stop=t_stop)
 
-    # use slow python implementation for the time being
-    # TODO: provide optimized C/weave implementation if possible
+    # Single spike train. inh_gamma_population generates many neurons at once
     def inh_gamma_generator(self, a, b, t, t_stop, array=False):
         """
         Returns a SpikeList whose spikes are a realization of an inhomogeneous gamma process
@@ -600,7 +1223,7 @@ class StGen:
 
         # return empty if no spikes
         if len(ps) == 0:
-            return SpikeTrain(numpy.array([]), t_start=t[0], t_stop=t_stop)
+            return SpikeTrain.from_sorted(numpy.array([]), t_start=t[0], t_stop=t_stop)
 
         # gen uniform rand on 0,1 for each spike
         rn = numpy.array(self.rng.uniform(0, 1, len(ps)))
@@ -640,10 +1263,10 @@ class StGen:
         if array:
             return spike_train
 
-        return SpikeTrain(spike_train, t_start=t[0], t_stop=t_stop)
+        return SpikeTrain.from_sorted(spike_train, t_start=t[0], t_stop=t_stop)
 
-    # use slow python implementation for the time being
-    # TODO: provide optimized C/weave implementation if possible
+    # Single spike train. inh_adaptingmarkov_population generates many neurons
+    # at once
     inh_adaptingmarkov_generator = _inh_adaptingmarkov_generator_python
 
     def _inh_2Dadaptingmarkov_generator_python(self, a, bq, tau_s, tau_r, qrqs, t, t_stop, array=False):
@@ -720,7 +1343,7 @@ class StGen:
 
         # return empty if no spikes
         if len(ps) == 0:
-            return SpikeTrain(numpy.array([]), t_start=t[0], t_stop=t_stop)
+            return SpikeTrain.from_sorted(numpy.array([]), t_start=t[0], t_stop=t_stop)
 
         # gen uniform rand on 0,1 for each spike
         rn = numpy.array(self.rng.uniform(0, 1, len(ps)))
@@ -763,12 +1386,173 @@ class StGen:
         if array:
             return spike_train
 
-        return SpikeTrain(spike_train, t_start=t[0], t_stop=t_stop)
+        return SpikeTrain.from_sorted(spike_train, t_start=t[0], t_stop=t_stop)
 
-    # use slow python implementation for the time being
-    # TODO: provide optimized C/weave implementation if possible
+    # Single spike train. inh_2Dadaptingmarkov_population generates many
+    # neurons at once
     inh_2Dadaptingmarkov_generator = _inh_2Dadaptingmarkov_generator_python
 
+    def _thin_population(self, rmax, t, t_stop, step):
+        """
+        Thin Poisson processes of rates rmax (one per neuron) between t[0] and
+        t_stop, advancing all the neurons in lock-step: step(rows, times, bins)
+        is called with the k-th candidate spike of all the neurons (rows) which
+        have one, for k = 0, 1, ..., and returns which of these spikes are kept.
+
+        Returns the numbers of kept spikes and their times, grouped by neuron.
+        """
+        counts, times = self._poisson_columns(rmax, t[0], t_stop)
+        starts = numpy.cumsum(counts) - counts
+        bins = numpy.searchsorted(t, times, 'right') - 1
+        # The neurons with the most candidates come first, so that the
+        # neurons with a k-th candidate are a prefix of order
+        order = numpy.argsort(-counts, kind='mergesort')
+        n_active = -counts[order]
+        keep = numpy.zeros(len(times), bool)
+        for k in xrange(counts.max() if len(counts) > 0 else 0):
+            rows = order[:n_active.searchsorted(-k, 'left')]
+            idx = starts[rows] + k
+            keep[idx] = step(rows, times[idx], bins[idx])
+        kept = numpy.repeat(numpy.arange(len(counts)), counts)[keep]
+        return numpy.bincount(kept, minlength=len(counts)), times[keep]
+
+    def _population_parameters(self, id_list, t, *params):
+        """
+        Return the sorted ids and the parameters, of shape (neurons, bins), of
+        a population generator, sorted like the ids
+        """
+        params = [numpy.atleast_2d(numpy.asarray(p, 'float')) for p in params]
+        for p in params:
+            if p.shape[1] != len(t):
+                raise ValueError('shape mismatch: the parameters must have a value per time bin')
+        if id_list is None:
+            id_list = numpy.arange(max(p.shape[0] for p in params))
+        id_list = numpy.asarray(id_list)
+        order = numpy.argsort(id_list, kind='mergesort')
+        params = [p * numpy.ones((len(id_list), 1)) for p in params]
+        return [id_list[order]] + [p[order] for p in params]
+
+    def inh_gamma_population(self, a, b, t, t_stop, id_list=None, array=False, state=None):
+        """
+        Returns a SpikeList whose SpikeTrains are independent realizations of
+        inhomogeneous gamma processes, as inh_gamma_generator. All the neurons
+        are generated at once, the thinning of their spikes advancing in
+        lock-step. The hazard function is interpolated in a table on a fixed
+        lattice of a, which is computed once (see gamma_hazard_table).
+
+        Inputs:
+            a,b     - arrays of shape (neurons, bins) of the parameters of the
+                      gamma PDF where a[:, i] and b[:, i] will be active on
+                      interval [t[i],t[i+1]], or of shape (bins,) to use the
+                      same parameters for all the neurons of id_list
+            t       - an array specifying the time bins (in milliseconds) at
+                      which to specify the parameters
+            t_stop  - length of time to simulate process (in ms)
+            id_list - the ids of the neurons. Default is range(len(a))
+            array   - if True, the arrays (ids, times) of all the spikes,
+                      grouped by id and sorted by time, are returned rather
+                      than a SpikeList object.
+            state   - a dict keeping the times of the last spikes between
+                      successive calls, for consecutive chunks of the same
+                      processes (see population_stream)
+
+        See also:
+            inh_gamma_generator, gamma_hazard_table
+        """
+        ids, a, b = self._population_parameters(id_list, t, a, b)
+        steps = 16
+        table, k_min, dv = gamma_hazard_table(a, steps)
+        # Position of the a in the rows of the table
+        k = numpy.log2(a) * steps - k_min
+        rmax = numpy.max(1.0 / b, axis=1)
+        if state is None:
+            state = {}
+        t_last = state.setdefault('t_last', numpy.zeros(len(ids)))
+
+        def step(rows, times, bins):
+            scale = b[rows, bins]
+            # hazard(x, a, b) = hazard(x / b, a, 1) / b, interpolated in the
+            # table with the intervals in units of the mean interval a * b
+            v = numpy.minimum((times - t_last[rows]) / 1000.0 / scale /
+                              a[rows, bins] / dv, table.shape[1] - 1)
+            i = numpy.minimum(v.astype(int), table.shape[1] - 2)
+            v -= i
+            shape = k[rows, bins]
+            j = shape.astype(int)
+            shape -= j
+            hazard = (1 - shape) * ((1 - v) * table[j, i] + v * table[j, i + 1]) + \
+                shape * ((1 - v) * table[j + 1, i] + v * table[j + 1, i + 1])
+            kept = self.rng.uniform(0, 1, len(rows)) < hazard / scale / rmax[rows]
+            t_last[rows[kept]] = times[kept]
+            return kept
+
+        counts, times = self._thin_population(rmax, t, t_stop, step)
+        return _population(ids, counts, times, t[0], t_stop, array)
+
+    def inh_adaptingmarkov_population(self, a, bq, tau, t, t_stop, id_list=None, array=False, state=None):
+        """
+        Returns a SpikeList whose SpikeTrains are independent realizations of
+        the inhomogeneous adapting markov process of
+        inh_adaptingmarkov_generator. All the neurons are generated at once,
+        the thinning of their spikes advancing in lock-step.
+
+        a and bq are arrays of shape (neurons, bins), or (bins,) to use the same
+        parameters for all the neurons of id_list. The other inputs are those
+        of inh_adaptingmarkov_generator.
+
+        See also:
+            inh_adaptingmarkov_generator, inh_2Dadaptingmarkov_population
+        """
+        return self.inh_2Dadaptingmarkov_population(a, bq, tau, None, 0., t, t_stop, id_list, array, state)
+
+    def inh_2Dadaptingmarkov_population(self, a, bq, tau_s, tau_r, qrqs, t, t_stop, id_list=None, array=False, state=None):
+        """
+        Returns a SpikeList whose SpikeTrains are independent realizations of
+        the inhomogeneous 2D adapting markov process of
+        inh_2Dadaptingmarkov_generator. All the neurons are generated at once,
+        the thinning of their spikes advancing in lock-step.
+
+        a and bq are arrays of shape (neurons, bins), or (bins,) to use the same
+        parameters for all the neurons of id_list. The other inputs are those
+        of inh_2Dadaptingmarkov_generator. If tau_r is None, there is no
+        refractory state, as in inh_adaptingmarkov_generator.
+
+        If state is a dict, the adaptation and refractory states are kept in
+        it between successive calls, for consecutive chunks of the same
+        processes (see population_stream).
+
+        See also:
+            inh_2Dadaptingmarkov_generator, inh_adaptingmarkov_population
+        """
+        ids, a, bq = self._population_parameters(id_list, t, a, bq)
+        rmax = numpy.max(a, axis=1)
+        if state is None:
+            state = {}
+        # initial adaptation state is unadapted, i.e. large t_s
+        t_s = state.setdefault('t_s', 1000 * tau_s * numpy.ones(len(ids)))
+        t_r = state.setdefault('t_r', 1000 * tau_s * numpy.ones(len(ids)))
+        t_prev = state.setdefault('t_prev', numpy.zeros(len(ids)))
+
+        def step(rows, times, bins):
+            # evolve the states up to the candidate spike
+            t_s[rows] += times - t_prev[rows]
+            t_r[rows] += times - t_prev[rows]
+            t_prev[rows] = times
+            g = numpy.exp(-t_s[rows] / tau_s)
+            if tau_r is not None:
+                g += qrqs * numpy.exp(-t_r[rows] / tau_r)
+            hazard = a[rows, bins] * numpy.exp(-bq[rows, bins] * g)
+            kept = self.rng.uniform(0, 1, len(rows)) < hazard / rmax[rows]
+            # remap the states of the neurons which spiked
+            rows = rows[kept]
+            t_s[rows] = -tau_s * numpy.log(numpy.exp(-t_s[rows] / tau_s) + 1)
+            if tau_r is not None:
+                t_r[rows] = -tau_r * numpy.log(numpy.exp(-t_r[rows] / tau_r) + 1)
+            return kept
+
+        counts, times = self._thin_population(rmax, t, t_stop, step)
+        return _population(ids, counts, times, t[0], t_stop, array)
+
     def _OU_generator_python(self, dt, tau, sigma, y0, t_start=0.0, t_stop=1000.0, array=True, time_it=False):
         """
         Generates an Orstein Ulbeck process using the forward euler method. The function returns
@@ -817,9 +1601,6 @@ class StGen:
         else:
             raise NotImplementedError()
 
-    # use slow python implementation for the time being
-    # TODO: provide optimized C/weave implementation if possible
-
     def _OU_generator_python2(self, dt, tau, sigma, y0, t_start=0.0, t_stop=1000.0, array=False, time_it=False):
         """
         Generates an Orstein Ulbeck process using the forward euler method. The function returns
@@ -870,68 +1651,72 @@ class StGen:
         else:
             raise NotImplementedError()
 
-    # use slow python implementation for the time being
-    # TODO: provide optimized C/weave implementation if possible
-
     def OU_generator_weave1(self, dt, tau, sigma, y0, t_start=0.0, t_stop=1000.0, time_it=False):
         """
-        Generates an Orstein Ulbeck process using the forward euler method. The function returns
-        an AnalogSignal object.
+        Same as OU_generator, which does not need scipy.weave anymore. Kept for
+        backward compatibility, returns the tuple (y,t).
 
-        OU_generator_weave1, as opposed to OU_generator, uses scipy.weave
-        and is thus much faster.
+        See also:
+            OU_generator
+        """
+        return self._OU_generator_lfilter(dt, tau, sigma, y0, t_start, t_stop,
+                                          array=True, time_it=time_it)
+
+    def _OU_filter(self, dt, tau, sigma, mu, y0, shape, exact):
+        """
+        Return OU processes of the given shape (..., time bins) reverting to
+        the means mu, starting at y0. The recursion on the time bins is
+        computed by scipy.signal.lfilter.
+        """
+        from scipy.signal import lfilter
+        if exact:
+            m = numpy.exp(-dt / tau)
+            c = 1 - m
+            s = sigma * numpy.sqrt(1 - m ** 2)
+        else:
+            c = dt / tau
+            m = 1 - c
+            s = numpy.sqrt(2 * c) * sigma
+        x = numpy.empty(shape, float)
+        x[..., 0] = y0
+        x[..., 1:] = c * numpy.broadcast_to(mu, shape)[..., :-1] + \
+            s * self.rng.standard_normal(shape[:-1] + (shape[-1] - 1,))
+        # y[i] = m * y[i-1] + x[i]
+        return lfilter([1.], [1., -m], x, axis=-1)
+
+    def _OU_generator_lfilter(self, dt, tau, sigma, y0, t_start=0.0, t_stop=1000.0, array=True, time_it=False, exact=False):
+        """
+        Generates an Orstein Ulbeck process using the forward euler method, or
+        the exact discretization of the process if exact is True. The function
+        returns the tuple (y,t) where y and t are the OU signal and the time
+        bins, respectively, and are both numpy arrays.
+
+        The recursion is computed by scipy.signal.lfilter, as fast as compiled
+        code for any length.
 
         Inputs:
             dt      - the time resolution in milliseconds of th signal
             tau     - the correlation time in milliseconds
             sigma   - std dev of the process
-            y0      - initial value of the process, at t_start
+            y0      - initial value of the process, at t_start, and its mean
             t_start - start time in milliseconds
             t_stop  - end time in milliseconds
-            array   - if True, the functions returns the tuple (y,t)
-                      where y and t are the OU signal and the time bins, respectively,
-                      and are both numpy arrays.
+            exact   - if True, the exact discretization of the process is
+                      used instead of the forward euler method
 
         Examples:
-            >> stgen.OU_generator_weave1(0.1, 2, 3, 0, 0, 10000)
+            >> stgen.OU_generator(0.1, 2, 3, 0, 0, 10000)
 
         See also:
-            OU_generator
+            OU_population, inh_OU_generator
         """
-        try:
-            import scipy.weave as weave
-        except:
-            import weave
-
         import time
 
         if time_it:
             t1 = time.time()
 
         t = numpy.arange(t_start, t_stop, dt)
-        N = len(t)
-        y = numpy.zeros(N, float)
-        y[0] = y0
-        fac = dt / tau
-        gauss = fac * y0 + numpy.sqrt(
-            2 * fac) * sigma * self.rng.standard_normal(N - 1)
-
-        # python loop... bad+slow!
-        #for i in xrange(1,len(t)):
-        # y[i] = y[i-1]+dt/tau*(y0-y[i-1])+numpy.sqrt(2*dt/tau)*sigma*numpy.ran
-        # dom.normal()
-        # use weave instead
-        code = """
-
-        double f = 1.0-fac;
-
-        for(int i=1;i<Ny[0];i++) {
-          y(i) = y(i-1)*f + gauss(i-1);
-        }
-        """
-
-        weave.inline(code, ['y', 'gauss', 'fac'],
-                     type_converters=weave.converters.blitz)
+        y = self._OU_filter(dt, tau, sigma, y0, y0, (len(t),), exact)
 
         if time_it:
             print('Elapsed ', time.time() - t1, ' seconds.')
@@ -941,37 +1726,126 @@ class StGen:
         else:
             raise NotImplementedError()
 
-    OU_generator = _OU_generator_python2
+    OU_generator = _OU_generator_lfilter
 
-    # TODO: optimized inhomogeneous OU generator
+    def OU_population(self, dt, tau, sigma, y0, n, t_start=0.0, t_stop=1000.0, exact=False):
+        """
+        Generates n independent Orstein Ulbeck processes at once, as
+        OU_generator. Returns the tuple (y,t) where y is an array of shape
+        (n, time bins) and t the time bins.
 
+        y0 can be a single value or an array of n values.
 
-# TODO: have a array generator with spatio-temporal correlations
+        See also:
+            OU_generator, inh_OU_generator
+        """
+        t = numpy.arange(t_start, t_stop, dt)
+        y0 = numpy.asarray(y0, float) * numpy.ones(n)
+        y = self._OU_filter(dt, tau, sigma, y0[:, None], y0, (n, len(t)), exact)
+        return (y, t)
 
-# TODO fix shotnoise stuff below  ... and write tests
+    def inh_OU_generator(self, dt, tau, sigma, mu, y0=None, t_start=0.0, exact=False):
+        """
+        Generates an Orstein Ulbeck process reverting to the time-varying mean
+        mu, where mu[i] is active on the time bin [t[i],t[i+1]]. If mu is of
+        shape (n, time bins), n independent processes are generated at once.
 
-# Operations on spike trains
+        Returns the tuple (y,t) where y has the shape of mu and t are the time
+        bins.
 
-def _gen_g_add(spikes, tau, q, t, eps=1.0e-8):
+        Inputs:
+            dt      - the time resolution in milliseconds of th signal
+            tau     - the correlation time in milliseconds
+            sigma   - std dev of the process
+            mu      - the mean of the process in every time bin
+            y0      - initial value of the process, at t_start. Default is the
+                      first value of mu
+            t_start - start time in milliseconds
+            exact   - if True, the exact discretization of the process is
+                      used instead of the forward euler method
 
-    #spikes = poisson_generator(rate,t[-1])
+        See also:
+            OU_generator, OU_population
+        """
+        mu = numpy.asarray(mu, float)
+        t = t_start + dt * numpy.arange(mu.shape[-1])
+        if y0 is None:
+            y0 = mu[..., 0]
+        y = self._OU_filter(dt, tau, sigma, mu, y0, mu.shape, exact)
+        return (y, t)
 
-    gd_s = numpy.zeros(numpy.shape(t), 'float')
 
-    dt = t[1] - t[0]
+# Operations on spike trains
 
-    # time of vanishing significance
-    vs_t = -tau * log(eps / q)
-    kern = q * numpy.exp(-numpy.arange(0.0, vs_t, dt) / tau)
+def _population(ids, counts, times, t_start, t_stop, array):
+    """
+    Output of the population generators of StGen: a SpikeList built from the
+    columns of the spikes, or the arrays (ids, times) if array is True
+    """
+    if array:
+        return numpy.repeat(ids, counts), times
+    stops = numpy.cumsum(counts)
+    return SpikeList._from_columns(ids, stops - counts, stops, times,
+                                   ids, t_start, t_stop)
 
-    vs_idx = len(kern)
 
-    idx = numpy.clip(numpy.searchsorted(t, spikes), 0, len(t) - 1)
-    idx2 = numpy.clip(idx + vs_idx, 0, len(gd_s))
-    idx3 = idx2 - idx
+def _population_block(method, kwargs, seed, id_list, args):
+    """
+    Generate a block of the population of StGen.population_blocks, and return
+    the ids, the numbers of spikes and the spike times of the block, with its
+    t_start and t_stop
+    """
+    spikes = getattr(StGen(seed=seed), method)(*args, id_list=id_list, **kwargs)
+    ids, starts, stops, times = spikes.spiketrains.columns()
+    counts = stops - starts
+    if len(ids) < len(id_list):
+        # Add the silent neurons, to keep them in the SpikeList
+        all_counts = numpy.zeros(len(id_list), int)
+        all_counts[numpy.searchsorted(id_list, ids)] = counts
+        ids, counts = id_list, all_counts
+    return ids, counts, times, spikes.t_start, spikes.t_stop
+
+
+def _gen_g_add(spikes, tau, q, t, eps=1.0e-8):
+    """
+    Shot noise on the time axis t: every spike adds an exponentially decaying
+    kernel q*exp(-t/tau), starting at the first bin of t at or after the spike.
+
+    The spikes are counted in the bins of t and the counts are filtered by the
+    recursive exponential filter y[i] = exp(-dt/tau)*y[i-1] + q*counts[i].
+    The kernel is not truncated; eps, the level at which the kernel used to be
+    cut, is kept for compatibility.
+    """
+    return _gen_g_add_population([spikes], tau, q, t, eps)[0]
 
-    for i in xrange(len(idx)):
 
-        gd_s[idx[i]:idx2[i]] += kern[0:idx3[i]]
+def _gen_g_add_population(spikes, tau, q, t, eps=1.0e-8):
+    """
+    Shot noise of many spike trains at once, as _gen_g_add. Returns an array
+    of shape (len(spikes), len(t)).
 
-    return gd_s
+    Inputs:
+        spikes - a SpikeList (rows in the order of its id_list) or a sequence
+                 of arrays of spike times
+        tau    - the time constant of the kernel
+        q      - the amplitude of the kernel, a scalar or one per spike train
+        t      - the regularly spaced time axis
+    """
+    from scipy.signal import lfilter
+    t = numpy.asarray(t)
+    if isinstance(spikes, SpikeList):
+        ids, starts, stops, times = spikes.spiketrains.columns()
+        rows = numpy.repeat(spikes.id_list().searchsorted(ids), stops - starts)
+        n = len(spikes)
+    else:
+        n = len(spikes)
+        lengths = [len(s) for s in spikes]
+        rows = numpy.repeat(numpy.arange(n), lengths)
+        times = numpy.concatenate([numpy.asarray(s, float) for s in spikes] +
+                                  [numpy.zeros(0)])
+    dt = t[1] - t[0]
+    idx = numpy.clip(numpy.searchsorted(t, times), 0, len(t) - 1)
+    counts = numpy.bincount(rows * len(t) + idx, minlength=n * len(t))
+    counts = counts.reshape(n, len(t)).astype(float)
+    counts *= numpy.reshape(q, (-1, 1))
+    return lfilter([1.], [1., -numpy.exp(-dt / tau)], counts, axis=-1)
@@ -0,0 +1,220 @@
+#-----------------------------------------------------------------------------
+# Purpose:
+#
+# Copyright : University of Zurich, Giacomo Indiveri, Emre Neftci, Sadique Sheik, Fabio Stefanini
+# Licence : GPLv2
+#-----------------------------------------------------------------------------
+"""
+Cache of encoded stimuli.
+
+Generating a random stimulus, building its SpikeList and encoding it to
+physical addresses with channelAddressing.exportAER takes much longer than
+sending it. StimulusCache keeps the encoded events of the stimuli, keyed by
+the addresses of the group, the generator, its parameters and the seed, so
+that a repeated stimulus is only generated once.
+"""
+from __future__ import absolute_import
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+import numpy as np
+
+from .STsl import STCreate
+
+
+def _key_token(obj):
+    """
+    Return a hashable description of obj, in which numpy arrays are replaced
+    by their type, shape and a hash of their data
+    """
+    if isinstance(obj, np.ndarray):
+        data = np.ascontiguousarray(obj)
+        return ('ndarray', data.dtype.str, data.shape,
+                hashlib.sha1(data.tostring()).hexdigest())
+    if isinstance(obj, dict):
+        return ('dict',) + tuple(sorted((repr(k), _key_token(v))
+                                        for k, v in obj.iteritems()))
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(_key_token(v) for v in obj)
+    if isinstance(obj, np.generic):
+        return repr(obj.item())
+    return repr(obj)
+
+
+def _generator_name(generator):
+    """
+    Return the qualified name of the function generator, including its module
+    and its class for a method, which identifies it across sessions. Raise a
+    ValueError if the function cannot be found back from this name, e.g. for
+    a lambda or a nested function.
+    """
+    function = getattr(generator, '__func__', generator)
+    module = getattr(function, '__module__', None)
+    if hasattr(function, '__qualname__'):
+        path = function.__qualname__.split('.')
+    elif getattr(generator, 'im_class', None) is not None:
+        path = [generator.im_class.__name__, function.__name__]
+    else:
+        path = [getattr(function, '__name__', None)]
+    obj = sys.modules.get(module)
+    for name in path:
+        obj = getattr(obj, str(name), None)
+    if obj is None or getattr(obj, '__func__', obj) is not function:
+        raise ValueError('The generator {0!r} has no stable name, use a '
+                         'module-level function'.format(generator))
+    return '.'.join([module] + path)
+
+
+class StimulusCache(object):
+    """
+    StimulusCache(channel_addressing, maxsize=16, path=None)
+
+    A cache of stimuli encoded to physical addresses, as returned by
+    channel_addressing.exportAER. The encoded events are uint32 arrays of
+    (address, time in us) which can be passed to NeuroSetup.run or
+    NeuroSetup.stimulate instead of the SpikeLists.
+
+    The least recently used stimuli are evicted when more than maxsize are
+    kept in memory. If path is given, the stimuli are also saved in this
+    directory and loaded from it, so they can be shared between sessions.
+
+    Inputs:
+        channel_addressing - the channelAddressing encoding the stimuli,
+                             e.g. NeuroSetup.mon
+        maxsize            - the number of stimuli kept in memory
+        path               - a directory in which the stimuli are saved
+
+    Examples:
+        >> cache = pyST.StimulusCache(nsetup.mon, path='stimuli')
+        >> for i in range(10):
+        ..     stim = cache.stimulus(pop.soma, 'spiketrains_poisson',
+        ..                           {'rate': 100, 'duration': 1000}, seed=i % 2)
+        ..     nsetup.run(stim)
+    """
+
+    def __init__(self, channel_addressing, maxsize=16, path=None):
+        self.channel_addressing = channel_addressing
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._stimuli = OrderedDict()
+
+    def __len__(self):
+        return len(self._stimuli)
+
+    def __contains__(self, key):
+        return key in self._stimuli or \
+            self.path is not None and os.path.exists(self._filename(key))
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+    def key(self, group, generator, params={}, seed=None):
+        """
+        Return the key of a stimulus: a hash of the physical addresses and
+        the channel of the group, of the qualified name of the generator, of
+        its parameters and of the seed.
+        """
+        if isinstance(generator, basestring):
+            generator = str(generator)
+        else:
+            generator = _generator_name(generator)
+        token = (_key_token(np.asarray(group.paddr)), repr(group.channel),
+                 generator, _key_token(params), _key_token(seed))
+        return hashlib.sha1(repr(token)).hexdigest()
+
+    def get(self, key):
+        """
+        Return the encoded events of the stimulus with the given key, or None
+        if it is not in the cache
+        """
+        if key in self._stimuli:
+            evs = self._stimuli.pop(key)
+        elif self.path is not None and os.path.exists(self._filename(key)):
+            evs = np.load(self._filename(key))
+            evs.flags.writeable = False
+        else:
+            return None
+        self._stimuli[key] = evs
+        self._evict()
+        return evs
+
+    def put(self, key, evs):
+        """
+        Add the encoded events of a stimulus to the cache
+        """
+        evs = np.array(evs, 'uint32').reshape(-1, 2)
+        evs.flags.writeable = False
+        self._stimuli.pop(key, None)
+        self._stimuli[key] = evs
+        self._evict()
+        if self.path is not None:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            np.save(self._filename(key), evs)
+        return evs
+
+    def _evict(self):
+        while len(self._stimuli) > self.maxsize:
+            self._stimuli.popitem(last=False)
+
+    def clear(self, disk=False):
+        """
+        Empty the cache in memory, and on disk if disk is True
+        """
+        self._stimuli.clear()
+        if disk and self.path is not None and os.path.isdir(self.path):
+            for filename in os.listdir(self.path):
+                if filename.endswith('.npy'):
+                    os.remove(os.path.join(self.path, filename))
+
+    def encode(self, stim):
+        """
+        Encode a stimulus (as accepted by channelAddressing.exportAER) to a
+        uint32 array of (physical address, absolute time in us)
+        """
+        evs = self.channel_addressing.exportAER(stim, isi=False)
+        return np.array(evs.get_adtmev(), 'uint32').reshape(-1, 2)
+
+    def stimulus(self, group, generator, params={}, seed=None):
+        """
+        Return the encoded events of the stimulus generated by the method
+        generator of group (e.g. 'spiketrains_poisson') called with the
+        keyword arguments params. The stimulus is generated and encoded only
+        if it is not in the cache.
+
+        If seed is given, STCreate is seeded with it during the generation
+        (its state is restored afterwards), so that the same stimulus is
+        obtained with or without the cache. Otherwise the stimulus is drawn
+        once and then repeated.
+
+        Inputs:
+            group     - an AddrGroup, e.g. population.soma
+            generator - the name of a spiketrains method of the group, or a
+                        function called as generator(group, **params). The
+                        function is identified by its module and qualified
+                        name, lambdas and nested functions are refused
+            params    - the keyword arguments of the generator
+            seed      - the seed of the stimulus
+        """
+        key = self.key(group, generator, params, seed)
+        evs = self.get(key)
+        if evs is not None:
+            self.hits += 1
+            return evs
+        self.misses += 1
+        if isinstance(generator, basestring):
+            create = getattr(group, generator)
+        else:
+            create = lambda **kwargs: generator(group, **kwargs)
+        state = STCreate.rng.get_state()
+        if seed is not None:
+            STCreate.rng.seed(seed)
+        try:
+            stim = create(**params)
+        finally:
+            if seed is not None:
+                STCreate.rng.set_state(state)
+        return self.put(key, self.encode(stim))
@@ -164,6 +164,58 @@ class TestSequenceFunctions(unittest.TestCase):
         self.assertTrue(np.all(350>mon.sl.mean_rates()) and np.all(mon.sl.mean_rates()>100))
         self.assertTrue(np.all(mon_zero.sl.mean_rates()<2))
         
+    def testMapping_seed(self):
+        N=20
+        s=create_default_population(self.nsetup, 'seq', N)
+        t=create_default_population(self.nsetup, 'ifslwta', N)
+        m1=pyNCS.Mapping('', seed=3)
+        m1.connect(s.soma,t.synapses['excitatory0'], fashion='random_all2all', fashion_kwargs={'p':.3})
+        np.random.seed(0)
+        m2=pyNCS.Mapping('')
+        m2.connect(s.soma,t.synapses['excitatory0'], fashion='random_all2all', fashion_kwargs={'p':.3}, seed=3)
+        self.assertEqual(m1.mapping, m2.mapping)
+
+    def testStimulusCache(self):
+        N=10
+        s=create_default_population(self.nsetup, 'seq', N)
+        cache=pyST.StimulusCache(self.nsetup.mon, maxsize=1)
+        params={'rate': 100, 'duration': 500}
+        stim=cache.stimulus(s.soma, 'spiketrains_poisson', params, seed=1)
+        self.assertTrue(cache.stimulus(s.soma, 'spiketrains_poisson', dict(params), seed=1) is stim)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        pyST.STCreate.seed(1)
+        evs=self.nsetup.mon.exportAER(s.soma.spiketrains_poisson(**params), isi=False)
+        self.assertTrue(np.all(evs.get_adtmev()==stim))
+        cache.stimulus(s.soma, 'spiketrains_poisson', params, seed=2)
+        self.assertEqual(len(cache), 1)
+        self.nsetup.run(stim)
+        self.assertRaises(ValueError, cache.key, s.soma, lambda group: group)
+        self.assertTrue(cache.stimulus(s.soma, u'spiketrains_poisson', params, seed=2) is
+                        cache.stimulus(s.soma, 'spiketrains_poisson', params, seed=2))
+        self.assertNotEqual(cache.key(s.soma, create_default_population),
+                            cache.key(s.soma, 'create_default_population'))
+
+    def testSpiketrains_stream(self):
+        N=10
+        s=create_default_population(self.nsetup, 'seq', N)
+        chunks=list(s.soma.spiketrains_stream('inh_gamma_population', 200., duration=1000., a=2., b=.025))
+        self.assertEqual(len(chunks), 5)
+        evs=np.concatenate(chunks)
+        self.assertTrue(np.all(np.in1d(evs[:,0], s.soma.paddr)))
+        self.assertTrue(np.cumsum(evs[:,1], dtype='int64')[-1] < 1000000)
+
+    def testSpiketrains_correlated(self):
+        N=10
+        s=create_default_population(self.nsetup, 'seq', N)
+        stim=s.soma.spiketrains_correlated(20, .2, jitter=1., duration=1000.)
+        evs=self.nsetup.mon.exportAER(stim, isi=False)
+        self.assertTrue(np.all(np.in1d(evs.get_ad(), s.soma.paddr)))
+        self.assertEqual(len(evs), len(stim[s.soma.channel].raw_data()))
+
+    def testRun_trials_onsets(self):
+        self.assertRaises(ValueError, self.nsetup.run_trials, 3,
+                          onsets=[0., 100.])
+
     def testPMappingLarge(self):
         N=124
         p=0.5
@@ -3,6 +3,10 @@ from pyNCS.pyST.STas import load_stas_from_csv, addrLogicalExtract, addrLogicalC
 import unittest
 import numpy as np
 import copy
+import os
+import shutil
+import tempfile
+import warnings
 
 class TestSequenceFunctions(unittest.TestCase):
 
@@ -372,6 +376,376 @@ class TestSequenceFunctions(unittest.TestCase):
                 self.assertAlmostEquals(a[c], sl2.raw_data()[i][c], 3)
 
 
+    def testSpikeTrain_distances(self):
+        st1 = SpikeTrain([10., 50., 52.], 0, 100)
+        st2 = SpikeTrain([11., 70.], 0, 100)
+        self.assertAlmostEqual(st1.distance_victorpurpura(st2, 0.5), 3.5)
+        self.assertAlmostEqual(st1.distance_victorpurpura(st2, 0), 1)
+        self.assertAlmostEqual(st1.distance_vanrossum(st1), 0)
+        # Single spike against no spike: sqrt(1/2)
+        self.assertAlmostEqual(
+            SpikeTrain([10.], 0, 100).distance_vanrossum(SpikeTrain([], 0, 100)),
+            np.sqrt(.5))
+
+    def testSpikeList_distance_matrix(self):
+        sl = SpikeList([(0, 10.), (0, 50.), (1, 11.), (2, 70.)], range(3))
+        d = sl.distance_matrix('victorpurpura', processes=2, cost=0.5)
+        self.assertTrue(np.all(d == d.T))
+        self.assertAlmostEqual(d[0, 1], sl[0].distance_victorpurpura(sl[1], 0.5))
+        d2 = sl.distance_matrix(ids=[0, 1], spikelist=sl.time_slice(0, 20),
+                                processes=1)
+        self.assertEqual(d2.shape, (2, 2))
+        self.assertAlmostEqual(d2[1, 1], 0)
+
+    def testSpikeList_correlations(self):
+        sl = SpikeList([(0, 10.), (0, 50.), (1, 12.), (1, 49.), (2, 30.)],
+                       range(3), 0, 100)
+        lags, ccg = sl.cross_correlograms(1., 5., [(0, 1)], processes=1)
+        self.assertEqual(len(lags), 11)
+        self.assertEqual(ccg[0, lags.tolist().index(2.)], 1)
+        self.assertEqual(ccg[0, lags.tolist().index(-1.)], 1)
+        self.assertEqual(ccg.sum(), 2)
+        c = sl.correlation_matrix(20.)
+        self.assertTrue(np.allclose(c, np.corrcoef(sl.spike_histogram(20.))))
+
+    def testSpikeList_raster_density(self):
+        import pylab
+        ids = np.repeat(np.arange(50), 20)
+        times = np.random.uniform(0, 1000, len(ids))
+        sl = SpikeList(zip(ids, times), range(50), 0, 1000)
+        sl.raster_plot(density=True)
+        ax = pylab.gca()
+        counts = ax.images[0].get_array()
+        self.assertEqual(counts.sum(), len(times))
+        ax.set_xlim(100, 200)
+        counts = ax.images[0].get_array()
+        self.assertEqual(counts.sum(), np.sum((times >= 100) & (times <= 200)))
+        sl.raster_plot(decimate=5, density_threshold=10 ** 6)
+        self.assertEqual(len(pylab.gca().lines[0].get_xdata()), 200)
+        pylab.close('all')
+
+    def testSTsl_composite_plot_movie(self):
+        from pyNCS.pyST import STsl
+        ids = np.repeat(np.arange(10), 10)
+        times = np.random.uniform(0, 100, len(ids))
+        sl = SpikeList(zip(ids, times), range(10), 0, 100)
+        self.assertEqual(STsl.composite_plot_movie(sl, output=None), None)
+        frames = STsl.composite_plot_movie(sl, time_bin=10, output=None,
+                                           return_frames=True)
+        self.assertEqual(frames.shape[0], 10)
+        self.assertEqual(frames.shape[3], 3)
+        self.assertTrue(np.any(frames[0] != frames[-1]))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            STsl.composite_plot_movie(sl, time_bin=50, output=None,
+                                      display=True)
+        self.assertEqual(w[0].category, DeprecationWarning)
+
+    def testSpikeList_windowed_stats(self):
+        ids = np.random.randint(0, 20, 2000)
+        times = np.random.uniform(0, 1000, len(ids))
+        sl = SpikeList(zip(ids, times), range(22), 0, 1000)
+        starts = sl.window_axis(200, 50)
+        self.assertEqual(len(starts), 17)
+        rates = sl.windowed_rates(200, 50)
+        cvs = sl.windowed_cv_isi(200, 50)
+        fanos = sl.windowed_fano_factors(200, 50, 10, average=True)
+        self.assertEqual(rates.shape, (17, 22))
+        for k in [0, 7, 16]:
+            sub = sl.time_slice(starts[k], starts[k] + 200)
+            self.assertTrue(np.allclose(rates[k], sub.mean_rates(starts[k], starts[k] + 200)))
+            self.assertTrue(np.allclose(cvs[k], sub.cv_isi(), equal_nan=True))
+            self.assertAlmostEqual(fanos[k], sub.fano_factor(10))
+        self.assertTrue(np.all(np.isnan(cvs[:, 21])))
+
+    def testSpikeTrials(self):
+        trials = SpikeTrials()
+        spikelists = []
+        for k in range(3):
+            ids = np.random.randint(0, 10, 500)
+            times = 100. * k + np.random.uniform(0, 50, len(ids))
+            sl = SpikeList(zip(ids, times), range(11), 100. * k, 100. * k + 50)
+            sl.time_offset(-100. * k)
+            spikelists.append(sl)
+            trials.append(SpikeList(zip(ids, times), range(11), 100. * k, 100. * k + 50), 100. * k)
+        self.assertEqual(len(trials), 3)
+        self.assertEqual((trials.t_start, trials.t_stop), (0, 50))
+        self.assertTrue(np.all(trials[1][4].spike_times == spikelists[1][4].spike_times))
+        psth = np.mean([sl.spike_histogram(5, normalized=True) for sl in spikelists], axis=0)
+        self.assertTrue(np.allclose(trials.psth(5), psth))
+        rates = np.array([sl.mean_rates() for sl in spikelists])
+        self.assertTrue(np.allclose(trials.mean_rates(), rates.mean(axis=0)))
+        counts = rates * 50 / 1000.
+        fanos = trials.fano_factors()
+        self.assertTrue(np.allclose(fanos[:10], counts.var(axis=0)[:10] / counts.mean(axis=0)[:10]))
+        self.assertTrue(np.isnan(fanos[10]))
+
+    def testSpikeTrials_early_spikes(self):
+        trials = SpikeTrials()
+        trials.append(SpikeList([(0, 50.), (0, 150.), (1, 120.), (2, 80.)],
+                                range(3), 0, 300), 100.)
+        self.assertEqual((trials.t_start, trials.t_stop), (0, 200))
+        self.assertTrue(np.all(trials[0][0].spike_times == [50.]))
+        self.assertTrue(np.all(trials[0][1].spike_times == [20.]))
+        self.assertEqual(len(trials[0][2]), 0)
+
+    def testSpikeList_sparse_spike_histogram(self):
+        ids = np.random.randint(0, 20, 1000)
+        times = np.random.uniform(0, 500, len(ids))
+        sl = SpikeList(zip(ids, times), range(21), 0, 500)
+        counts = sl.sparse_spike_histogram(10, dtype=np.int32)
+        self.assertEqual(counts.dtype, np.int32)
+        self.assertTrue(np.all(counts.toarray() == sl.spike_histogram(10)))
+        smooth = sl.sparse_spike_histogram(10, tau=10.).toarray()
+        kernel = np.exp(-np.arange(5))
+        expected = np.array([np.convolve(row, kernel)[:counts.shape[1]]
+                             for row in counts.toarray()])
+        self.assertTrue(np.allclose(smooth, expected))
+        # Integer counts are smoothed in float
+        smooth = sl.sparse_spike_histogram(10, dtype=np.int32, tau=10.)
+        self.assertEqual(smooth.dtype, np.float64)
+        self.assertTrue(np.allclose(smooth.toarray(), expected))
+
+    def testSTsl_ksi_spectrum(self):
+        from pyNCS.pyST import STsl
+        ids = np.random.randint(0, 10, 1000)
+        times = 25. * np.random.randint(0, 40, len(ids))
+        sl = SpikeList(zip(ids, times), range(10), 0, 1000)
+        spectrum = STsl.ksi_spectrum(sl, [40., 80., 7.5], chunk_size=100)
+        self.assertTrue(np.allclose(spectrum[:2], 1.))
+        self.assertAlmostEqual(spectrum[2], STsl.ksi(sl, pow_freq=7.5)[0])
+
+    def testStGen_poisson_population(self):
+        sl = STCreate.poisson_population([100., 0., 20.], 500, 1500,
+                                         id_list=[4, 2, 9])
+        self.assertTrue(np.all(sl.id_list() == [2, 4, 9]))
+        self.assertEqual((sl.t_start, sl.t_stop), (500, 1500))
+        self.assertEqual(len(sl[2].spike_times), 0)
+        times = sl[4].spike_times
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        self.assertTrue(np.all((times >= 500) & (times < 1500)))
+        sl = STCreate.poisson_population(100. * np.ones(1000), 0, 1000)
+        self.assertAlmostEqual(sl.mean_rate(), 100., delta=2.)
+
+    def testStGen_inh_poisson_population(self):
+        t = np.arange(0, 1000, 100.)
+        rates = np.zeros((300, len(t)))
+        rates[:, 2:5] = 200.
+        rates[:150, 7] = 50.
+        sl = STCreate.inh_poisson_population(rates, t, 1000, chunk_size=500)
+        self.assertEqual(len(sl), 300)
+        self.assertEqual((sl.t_start, sl.t_stop), (0, 1000))
+        ids, times = sl.convert("[ids, times]")
+        self.assertTrue(np.all((times >= 200) & (times < 500) |
+                               (times >= 700) & (times < 800) & (ids < 150)))
+        counts = sl.spike_histogram(100)
+        self.assertAlmostEqual(counts[:, 3].mean(), 20., delta=1.)
+        self.assertAlmostEqual(counts[:150, 7].mean(), 5., delta=1.)
+        # Bins beyond t_stop are cut
+        ids, times = STCreate.inh_poisson_population(
+            100 * np.ones((2, 3)), [0, 500, 1000], 700., array=True)
+        self.assertTrue(np.all(times < 700))
+        self.assertAlmostEqual(len(times), 140., delta=50.)
+
+    def testStGen_batched_thinning(self):
+        t = np.arange(0, 2000, 100.)
+        sl = STCreate.inh_gamma_population(4. * np.ones(len(t)), np.ones(len(t)) / 200.,
+                                           t, 2000., id_list=range(200))
+        self.assertAlmostEqual(sl.mean_rate(), 50., delta=2.5)
+        self.assertAlmostEqual(np.nanmean(sl.cv_isi()), .5, delta=.05)
+        # Heterogeneous shapes, interpolated between the rows of the table
+        shapes = np.repeat([[1.5], [7.3]], 150, axis=0) * np.ones(len(t))
+        sl = STCreate.inh_gamma_population(shapes, 1. / (50. * shapes), t, 2000.)
+        rates = sl.mean_rates()
+        cvs = np.array(sl.cv_isi())
+        self.assertAlmostEqual(np.mean(rates[:150]), 50., delta=2.5)
+        self.assertAlmostEqual(np.mean(rates[150:]), 50., delta=2.5)
+        self.assertAlmostEqual(np.nanmean(cvs[:150]), 1.5 ** -.5, delta=.05)
+        self.assertAlmostEqual(np.nanmean(cvs[150:]), 7.3 ** -.5, delta=.05)
+        a = np.where(t < 1000, 20., 60.)
+        bq = 2. * np.ones(len(t))
+        sl = STCreate.inh_adaptingmarkov_population(a, bq, 100., t, 2000., id_list=range(300))
+        ref = [len(STCreate.inh_adaptingmarkov_generator(a, bq, 100., t, 2000., array=True))
+               for i in range(100)]
+        self.assertAlmostEqual(sl.mean_rate() * 2., np.mean(ref), delta=.1 * np.mean(ref))
+
+    def testStGen_OU(self):
+        STCreate.seed(3)
+        y, t = STCreate.OU_generator(0.1, 2., 3., 1., 0, 100)
+        STCreate.seed(3)
+        y_loop, t_loop = STCreate._OU_generator_python2(0.1, 2., 3., 1., 0, 100, array=True)
+        self.assertTrue(np.allclose(y, y_loop))
+        y, t = STCreate.OU_population(0.1, 5., 2., 0., 100, 0, 500, exact=True)
+        self.assertEqual(y.shape, (100, len(t)))
+        self.assertAlmostEqual(y[:, 1000:].std(), 2., delta=.2)
+        mu = np.where(np.arange(4000) < 2000, 0., 10.)
+        y, t = STCreate.inh_OU_generator(0.1, 5., 1., np.tile(mu, (50, 1)))
+        self.assertAlmostEqual(y[:, 3000:].mean(), 10., delta=.5)
+
+    def testStGen_shotnoise(self):
+        from pyNCS.pyST.stgen import _gen_g_add, _gen_g_add_population
+        t = np.arange(0, 100, 0.5)
+        spikes = np.array([10., 10.2, 42., 99.2])
+        idx = np.searchsorted(t, spikes)
+        expected = sum(2. * np.exp(-(t - t[i]) / 5.) * (t >= t[i]) for i in idx)
+        self.assertTrue(np.allclose(_gen_g_add(spikes, 5., 2., t), expected))
+        sl = STCreate.poisson_population(100., 0, 100, id_list=range(5))
+        g = _gen_g_add_population(sl, 5., np.arange(5.), t)
+        self.assertEqual(g.shape, (5, len(t)))
+        for i in range(5):
+            self.assertTrue(np.allclose(g[i], i * _gen_g_add(sl[i].spike_times, 5., 1., t)))
+
+    def testStGen_spawn(self):
+        from pyNCS.pyST.stgen import StGen, spawn_seeds
+        seeds = spawn_seeds(42, 3)
+        self.assertTrue(np.array_equal(seeds[2], spawn_seeds(42, 5)[2]))
+        self.assertFalse(np.array_equal(seeds[0], seeds[1]))
+        gen = StGen(seed=1)
+        spikes = [g.poisson_generator(10, 0, 1000, array=True) for g in gen.spawn(3)]
+        gen.seed(1)
+        again = [g.poisson_generator(10, 0, 1000, array=True)
+                 for g in gen.spawn(2) + gen.spawn(1)]
+        for s1, s2 in zip(spikes, again):
+            self.assertTrue(np.array_equal(s1, s2))
+        rates = np.linspace(1, 100, 50)
+        ids = np.random.permutation(50)
+        sls = [StGen(seed=7).population_blocks('poisson_population', ids,
+                                               (rates, 0, 1000), rows=(0,),
+                                               block_size=8, processes=p)
+               for p in [1, 2]]
+        self.assertEqual(len(sls[0]), 50)
+        self.assertTrue(np.array_equal(sls[0].raw_data(), sls[1].raw_data()))
+
+    def testStGen_population_stream(self):
+        stream = STCreate.population_stream('inh_adaptingmarkov_population', 50.,
+                                            t_stop=5000., id_list=range(100),
+                                            a=100., bq=5., tau=20.)
+        chunks = list(stream)
+        self.assertEqual(len(chunks), 100)
+        for k, (ids, times) in enumerate(chunks):
+            self.assertTrue(np.all((times >= 50 * k) & (times < 50 * (k + 1))))
+        ids = np.concatenate([c[0] for c in chunks])
+        # The adaptation is carried from a chunk to the next
+        batch_ids, batch_times = STCreate.inh_adaptingmarkov_population(
+            [100.], [5.], 20., [0.], 5000., id_list=range(100), array=True)
+        self.assertAlmostEqual(len(ids) / 500., len(batch_ids) / 500., delta=1.5)
+        stream = STCreate.population_stream('inh_poisson_population', 1000.,
+                                            rates=np.zeros(10))
+        self.assertEqual(len(stream.next()[0]), 0)
+        self.assertTrue(len(stream.send({'rates': 100 * np.ones(10)})[0]) > 0)
+
+    def testStGen_regular_population(self):
+        rates = np.array([10., 0., 33., 100.])
+        phases = np.array([0., 1., -5., 2.])
+        sl = STCreate.regular_population(rates, phases, jitter=False, t_stop=1000)
+        for i in [0, 2, 3]:
+            ref = STCreate.regular_generator(rates[i], phases[i], jitter=False,
+                                             t_stop=1000, array=True)
+            ref = ref[(ref >= 0) & (ref <= 1000)]
+            self.assertTrue(np.allclose(sl[i].spike_times, ref))
+        self.assertEqual(len(sl[1]), 0)
+        sl = STCreate.regular_gaussian_population(10 * np.ones(500), 0., scale=5.,
+                                                  t_stop=1000, id_list=range(500, 0, -1))
+        self.assertEqual(sl.id_list().tolist(), range(1, 501))
+        times = np.concatenate([st.spike_times for st in sl])
+        self.assertAlmostEqual((times - np.round(times / 100.) * 100).std(), 5., delta=.3)
+
+    def testStGen_correlated_population(self):
+        n, t_stop = 20, 50000.
+        for name in ['mip', 'sip']:
+            ids, times = getattr(STCreate, name + '_population')(
+                20., .2, t_stop=t_stop, id_list=range(n), array=True)
+            counts = np.zeros((n, 1000))
+            np.add.at(counts, (ids.astype(int), (times / 50.).astype(int) % 1000), 1)
+            self.assertAlmostEqual(len(times) / (n * t_stop / 1000.), 20., delta=1.)
+            corr = np.corrcoef(counts)[np.triu_indices(n, 1)].mean()
+            self.assertAlmostEqual(corr, .2, delta=.05)
+        sl = STCreate.mip_population(20., .1, jitter=2., t_stop=1000,
+                                     id_list=range(50, 0, -1))
+        self.assertEqual(sl.id_list().tolist(), range(1, 51))
+        self.assertRaises(ValueError, STCreate.mip_population, [10., 100.], [.5, .5])
+
+    def testSpikeList_lazy_complete(self):
+        sl = SpikeList([(0, 10.), (0, 20.), (3, 15.)], range(4))
+        sl.complete(range(2**15))
+        self.assertEqual(len(sl), 2**15)
+        self.assertTrue(sl[5] is sl[2**15 - 1])
+        self.assertEqual(len(sl[5]), 0)
+        self.assertTrue(np.all(sl[0].spike_times == [10., 20.]))
+        self.assertEqual(sl.raw_data().shape, (3, 2))
+
+    def testSpikeTrain_from_sorted(self):
+        times = np.array([1., 2., 3., 8.])
+        st = SpikeTrain.from_sorted(times, 2., 5.)
+        self.assertTrue(np.all(st.spike_times == [2., 3.]))
+        self.assertTrue(st.spike_times.base is times)
+        st2 = SpikeTrain([8., 1., 3., 2.], 2., 5.)
+        self.assertTrue(np.all(st2.spike_times == st.spike_times))
+
+    def testSpikeList_shared_window(self):
+        sl = SpikeList([], [])
+        sl[0] = SpikeTrain([1., 5.], 0, 10)
+        sl[1] = SpikeTrain([3.], 2, 20)
+        self.assertEqual(sl[0].time_parameters(), (0, 20))
+        sl.t_stop = 50
+        self.assertEqual(sl[1].t_stop, 50)
+        sub = sl.id_slice([0])
+        sub.t_stop = 70
+        self.assertEqual(sl[0].t_stop, 50)
+
+    def testMergeSpikeLists(self):
+        sl1 = SpikeList([(0, 30.), (0, 10.), (1, 5.)], range(3))
+        sl2 = SpikeList([(0, 20.), (5, 40.)], [0, 5])
+        sl = merge_spikelists(sl1, sl2)
+        self.assertTrue(np.all(sl.id_list() == [0, 1, 2, 5]))
+        self.assertTrue(np.all(sl[0].spike_times == [10., 20., 30.]))
+        self.assertEqual(sl.time_parameters(), (0., 40.))
+        sl1.merge(sl2)
+        self.assertTrue(np.all(sl1[0].spike_times == [10., 20., 30.]))
+        self.assertEqual(len(sl1[5]), 1)
+
+    def testSpikeList_slices(self):
+        sl = SpikeList([(0, 10.), (0, 20.), (1, 15.), (1, 40.), (2, 5.)], range(4))
+        ts = sl.time_slice(10., 20.)
+        self.assertEqual(ts.time_parameters(), (10., 20.))
+        self.assertTrue(np.all(ts.id_list() == range(4)))
+        self.assertTrue(np.all(ts[0].spike_times == [10., 20.]))
+        self.assertEqual(len(ts[2]), 0)
+        ids = ts.id_slice([1, 3, 7])
+        self.assertTrue(np.all(ids.id_list() == [1, 3]))
+        self.assertTrue(np.all(ids[1].spike_times == [15.]))
+        cp = ids.copy()
+        cp.time_offset(5.)
+        self.assertTrue(np.all(ids[1].spike_times == [15.]))
+
+    def testSpikeList_binary(self):
+        path = tempfile.mkdtemp()
+        try:
+            sl = SpikeList([(0, 10.), (0, 20.), (1, 15.)], range(3), 0, 100)
+            sl.save_binary(path)
+            SpikeList([(1, 120.), (4, 110.)], [1, 4], 100, 200).save_binary(
+                path, append=True)
+            sl2 = load_binary(path)
+            self.assertTrue(np.all(sl2.id_list() == [0, 1, 2, 4]))
+            self.assertTrue(np.all(sl2[1].spike_times == [15., 120.]))
+            self.assertEqual(sl2.time_parameters(), (0, 200))
+            # Appending only writes the new spikes, which stay memory-mapped
+            self.assertEqual(len(np.load(os.path.join(path, 'times_1.npy'))), 2)
+            self.assertEqual(len(np.load(os.path.join(path, 'times.npy'))), 3)
+            chunks = [c[3] for c in sl2.spiketrains._chunks]
+            self.assertTrue(all(isinstance(c, np.memmap) for c in chunks))
+            self.assertTrue(np.may_share_memory(sl2[4].spike_times, chunks[1]))
+            SpikeList([(0, 5.), (5, 250.)], [0, 5], 0, 300).save_binary(
+                path, append=True)
+            sl3 = load_binary(path)
+            self.assertTrue(isinstance(sl3.spiketrains._chunks[2][3], np.memmap))
+            self.assertTrue(np.all(sl3.id_list() == [0, 1, 2, 4, 5]))
+            self.assertTrue(np.all(sl3[0].spike_times == [5., 10., 20.]))
+            self.assertEqual(sl3.time_parameters(), (0, 300))
+            self.assertEqual(len(sl3.time_slice(0, 100).raw_data()), 4)
+        finally:
+            shutil.rmtree(path)
+
     def testHashTable(self):
         addrHR=[range(64)]
         addrBuildHashTable(self.STcsMon[1])